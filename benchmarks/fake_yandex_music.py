@@ -0,0 +1,512 @@
+"""
+Local stand-in for the parts of the Yandex Music API used by the bot.
+
+Covers account status, tracks, albums, search, liked tracks and user playlists
+(list, get, create, change with insert/delete diffs and revisions), with
+configurable latency, per-token throttling and failure injection.
+
+Run it standalone and point the bot at it with `YANDEX_API_URL`:
+
+    python -m benchmarks.fake_yandex_music --port 8765 --users 50 --tracks 5000
+
+Every seeded user has the token `token-<n>` (n from 1).
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import zlib
+
+from aiohttp import web
+
+
+def error_response(status: int, name: str, description: str = "") -> web.Response:
+    """Builds an error response in the format the API uses."""
+
+    return web.json_response(
+        {"error": name, "error_description": description}, status=status
+    )
+
+
+def artist_json(name: str) -> dict:
+    """Builds an artist with a stable id derived from the name."""
+
+    return {"id": zlib.crc32(name.encode()) % 10**6, "name": name}
+
+
+def ok_response(result) -> web.Response:
+    """Wraps the result the way the API does."""
+
+    return web.json_response(
+        {"invocationInfo": {"hostname": "fake", "req-id": "fake"}, "result": result}
+    )
+
+
+class FakeAccount:
+    """
+    A user of the fake API with their likes and playlists.
+    """
+
+    def __init__(self, uid: int):
+        self.uid = uid
+        self.likes = []  # track ids, most recent first
+        self.playlists = {}  # kind -> playlist json
+        self.window = (0, 0)  # (second, requests in it), for throttling
+
+
+# The account of the request token, set by the middleware
+ACCOUNT_KEY = web.RequestKey("account", FakeAccount)
+
+
+class Faults:
+    """
+    Faults injected into the responses: `latency` (plus up to `jitter`) seconds
+    added to every response, at most `token_rate` requests per token per second
+    (429 when exceeded), a `failure_rate` share of requests answered with 500,
+    and `queued` exact error statuses for the next requests.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        token_rate: int | None = None,
+        failure_rate: float = 0.0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.token_rate = token_rate
+        self.failure_rate = failure_rate
+        self.queued = []
+
+
+class FakeYandexMusic:
+    """
+    In-memory Yandex Music: accounts, a catalog of tracks and albums, likes and playlists.
+
+    The latency, throttling and failure arguments configure the injected `faults`
+    (see `Faults`); `fail_next()` queues exact error statuses for the next requests.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        token_rate: int | None = None,
+        failure_rate: float = 0.0,
+        seed: int | None = None,
+    ):
+        self.faults = Faults(latency, jitter, token_rate, failure_rate)
+        self.random = random.Random(seed)
+
+        self.accounts = {}  # token -> FakeAccount
+        self.tracks = {}  # track id -> track json
+        self.albums = {}  # album id -> album json
+        self.requests = {}  # endpoint -> number of requests
+
+        self._runner = None
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace) -> "FakeYandexMusic":
+        """Creates a server from the latency, failure and seed command line options."""
+
+        return cls(
+            latency=args.latency,
+            jitter=args.jitter,
+            token_rate=args.token_rate,
+            failure_rate=args.failure_rate,
+            seed=args.seed,
+        )
+
+    # Seeding
+
+    def add_account(self, token: str, uid: int | None = None) -> int:
+        """Registers a token and returns the uid of its account."""
+
+        uid = uid or 1000 + len(self.accounts)
+        self.accounts[token] = FakeAccount(uid)
+        return uid
+
+    def account(self, uid: int) -> FakeAccount:
+        """Returns the account with the given uid."""
+
+        return next(account for account in self.accounts.values() if account.uid == uid)
+
+    def playlists(self) -> list[dict]:
+        """Returns the playlists of all accounts."""
+
+        return [
+            playlist
+            for account in self.accounts.values()
+            for playlist in account.playlists.values()
+        ]
+
+    def add_album(self, album_id: int, title: str, artists: list[str]) -> dict:
+        """Adds an album to the catalog."""
+
+        self.albums[album_id] = {
+            "id": album_id,
+            "title": title,
+            "artists": [artist_json(name) for name in artists],
+            "coverUri": f"avatars.yandex.net/get-music-content/{album_id}/%%",
+            "trackCount": 0,
+        }
+        return self.albums[album_id]
+
+    def add_track(
+        self, track_id: int, title: str, artists: list[str], album_id: int
+    ) -> dict:
+        """Adds a track to the catalog, creating its album if needed."""
+
+        album = self.albums.get(album_id) or self.add_album(
+            album_id, f"Album {album_id}", artists
+        )
+        album["trackCount"] += 1
+        self.tracks[track_id] = {
+            "id": str(track_id),
+            "title": title,
+            "available": True,
+            "artists": [artist_json(name) for name in artists],
+            "albums": [{"id": album_id, "title": album["title"]}],
+            "coverUri": album["coverUri"],
+        }
+        return self.tracks[track_id]
+
+    def like(self, uid: int, track_id: int) -> None:
+        """Puts the track on top of the user's liked tracks."""
+
+        self.account(uid).likes.insert(0, track_id)
+
+    def populate(
+        self, users: int, tracks: int, likes_per_user: int = 10, tracks_per_album=10
+    ) -> list[str]:
+        """
+        Seeds `users` accounts (tokens `token-1`...) and a catalog of `tracks` tracks,
+        each user liking `likes_per_user` random tracks. Returns the tokens.
+        """
+
+        for track_id in range(1, tracks + 1):
+            self.add_track(
+                track_id,
+                f"Track {track_id}",
+                [f"Artist {track_id % 97}"],
+                album_id=100_000 + (track_id - 1) // tracks_per_album,
+            )
+
+        tokens = []
+        for n in range(1, users + 1):
+            token = f"token-{n}"
+            uid = self.add_account(token)
+            for track_id in self.random.sample(
+                range(1, tracks + 1), min(likes_per_user, tracks)
+            ):
+                self.like(uid, track_id)
+            tokens.append(token)
+        return tokens
+
+    def fail_next(self, status: int, count: int = 1) -> None:
+        """Answers the next `count` requests with the given HTTP status."""
+
+        self.faults.queued.extend([status] * count)
+
+    # Middleware
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        """Applies latency, authorization, throttling and failure injection."""
+
+        resource = request.match_info.route.resource
+        endpoint = resource.canonical if resource else request.path
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+        faults = self.faults
+        if faults.latency or faults.jitter:
+            await asyncio.sleep(faults.latency + self.random.uniform(0, faults.jitter))
+
+        authorization = request.headers.get("Authorization", "")
+        token = authorization.removeprefix("OAuth ")
+        account = self.accounts.get(token)
+        if account is None:
+            return error_response(401, "session-expired", "Invalid OAuth token")
+        request[ACCOUNT_KEY] = account
+
+        if faults.token_rate:
+            second = int(time.monotonic())
+            window, count = account.window
+            count = count + 1 if window == second else 1
+            account.window = (second, count)
+            if count > faults.token_rate:
+                return error_response(429, "too-many-requests")
+
+        if faults.queued:
+            status = faults.queued.pop(0)
+            return error_response(status, "injected-failure")
+        if self.random.random() < faults.failure_rate:
+            return error_response(500, "internal-error")
+
+        return await handler(request)
+
+    # Handlers
+
+    @staticmethod
+    def _owner(request: web.Request) -> FakeAccount | web.Response:
+        account = request[ACCOUNT_KEY]
+        if int(request.match_info["uid"]) != account.uid:
+            return error_response(403, "forbidden")
+        return account
+
+    async def account_status(self, request: web.Request) -> web.Response:
+        """GET /account/status: the account of the request token."""
+
+        uid = request[ACCOUNT_KEY].uid
+        return ok_response(
+            {
+                "account": {
+                    "now": time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime()),
+                    "serviceAvailable": True,
+                    "uid": uid,
+                    "login": f"user{uid}",
+                    "fullName": f"User {uid}",
+                },
+                "permissions": {"until": "", "values": [], "default": []},
+            }
+        )
+
+    @staticmethod
+    async def _ids(request: web.Request, field: str) -> list[int]:
+        form = await request.post()
+        ids = []
+        for value in form.getall(field, []):
+            ids.extend(int(i) for i in str(value).split(",") if i.strip())
+        return ids
+
+    async def get_tracks(self, request: web.Request) -> web.Response:
+        """POST /tracks: the catalog tracks with the given ids."""
+
+        ids = await self._ids(request, "track-ids")
+        return ok_response([self.tracks[i] for i in ids if i in self.tracks])
+
+    async def get_albums(self, request: web.Request) -> web.Response:
+        """POST /albums: the catalog albums with the given ids."""
+
+        ids = await self._ids(request, "album-ids")
+        return ok_response([self.albums[i] for i in ids if i in self.albums])
+
+    async def search(self, request: web.Request) -> web.Response:
+        """GET /search: tracks and albums whose title or artist contains the text."""
+
+        text = request.query.get("text", "").lower()
+        type_ = request.query.get("type", "all")
+        page = int(request.query.get("page", 0))
+        per_page = 10
+
+        result = {
+            "searchRequestId": "fake",
+            "text": request.query.get("text", ""),
+            "best": None,
+            "misspellCorrected": False,
+        }
+        for kind, catalog in (("track", self.tracks), ("album", self.albums)):
+            if type_ not in (kind, "all"):
+                continue
+            found = [
+                item
+                for item in catalog.values()
+                if text in item["title"].lower()
+                or any(text in artist["name"].lower() for artist in item["artists"])
+            ]
+            result[f"{kind}s"] = {
+                "type": kind,
+                "total": len(found),
+                "perPage": per_page,
+                "order": 0,
+                "results": found[page * per_page : (page + 1) * per_page],
+            }
+        return ok_response(result)
+
+    async def liked_tracks(self, request: web.Request) -> web.Response:
+        """GET /users/{uid}/likes/tracks: the liked tracks, most recent first."""
+
+        account = self._owner(request)
+        if isinstance(account, web.Response):
+            return account
+        return ok_response(
+            {
+                "library": {
+                    "uid": account.uid,
+                    "revision": len(account.likes),
+                    "tracks": [
+                        {
+                            "id": str(track_id),
+                            "albumId": self.tracks[track_id]["albums"][0]["id"],
+                            "timestamp": "2024-01-01T00:00:00+00:00",
+                        }
+                        for track_id in account.likes
+                    ],
+                }
+            }
+        )
+
+    @staticmethod
+    def _playlist_header(playlist: dict) -> dict:
+        return {key: value for key, value in playlist.items() if key != "tracks"}
+
+    async def playlists_list(self, request: web.Request) -> web.Response:
+        """GET /users/{uid}/playlists/list: the playlists without their tracks."""
+
+        account = self._owner(request)
+        if isinstance(account, web.Response):
+            return account
+        return ok_response(
+            [self._playlist_header(playlist) for playlist in account.playlists.values()]
+        )
+
+    async def playlist(self, request: web.Request) -> web.Response:
+        """GET /users/{uid}/playlists/{kind}: a playlist with its tracks."""
+
+        account = self._owner(request)
+        if isinstance(account, web.Response):
+            return account
+        playlist = account.playlists.get(int(request.match_info["kind"]))
+        if playlist is None:
+            return error_response(404, "not-found", "Playlist not found")
+
+        tracks = []
+        for index, track in enumerate(playlist["tracks"]):
+            tracks.append(
+                {
+                    "id": int(track["id"]),
+                    "originalIndex": index,
+                    "timestamp": "2024-01-01T00:00:00+00:00",
+                    "track": self.tracks.get(int(track["id"])),
+                }
+            )
+        return ok_response({**playlist, "tracks": tracks})
+
+    async def create_playlist(self, request: web.Request) -> web.Response:
+        """POST /users/{uid}/playlists/create: a new empty playlist."""
+
+        account = self._owner(request)
+        if isinstance(account, web.Response):
+            return account
+        form = await request.post()
+        uid = account.uid
+        kind = 1000 + len(account.playlists)
+        playlist = {
+            "uid": uid,
+            "kind": kind,
+            "title": form.get("title", ""),
+            "visibility": form.get("visibility", "public"),
+            "revision": 1,
+            "trackCount": 0,
+            "owner": {"uid": uid, "login": f"user{uid}"},
+            "tracks": [],
+        }
+        account.playlists[kind] = playlist
+        return ok_response(self._playlist_header(playlist))
+
+    async def change_playlist(self, request: web.Request) -> web.Response:
+        """POST /users/{uid}/playlists/{kind}/change: applies a diff at a revision."""
+
+        account = self._owner(request)
+        if isinstance(account, web.Response):
+            return account
+        playlist = account.playlists.get(int(request.match_info["kind"]))
+        if playlist is None:
+            return error_response(404, "not-found", "Playlist not found")
+
+        form = await request.post()
+        if int(form.get("revision", -1)) != playlist["revision"]:
+            return error_response(412, "wrong-revision", "Playlist revision mismatch")
+
+        tracks = list(playlist["tracks"])
+        try:
+            for operation in json.loads(form["diff"]):
+                if operation["op"] == "insert":
+                    at = operation["at"]
+                    if not 0 <= at <= len(tracks):
+                        raise ValueError(f"insert at {at}")
+                    tracks[at:at] = [
+                        {"id": str(track["id"]), "albumId": track.get("albumId")}
+                        for track in operation["tracks"]
+                    ]
+                elif operation["op"] == "delete":
+                    start, end = operation["from"], operation["to"]
+                    if not 0 <= start < end <= len(tracks):
+                        raise ValueError(f"delete {start}:{end}")
+                    del tracks[start:end]
+                else:
+                    raise ValueError(f"operation {operation['op']}")
+        except (KeyError, TypeError, ValueError) as e:
+            return error_response(400, "validate", f"Invalid diff: {e}")
+
+        playlist["tracks"] = tracks
+        playlist["trackCount"] = len(tracks)
+        playlist["revision"] += 1
+        return ok_response(self._playlist_header(playlist))
+
+    # Server
+
+    def make_app(self) -> web.Application:
+        """Returns the aiohttp application serving the fake API."""
+
+        app = web.Application(middlewares=[self.middleware])
+        app.add_routes(
+            [
+                web.get("/account/status", self.account_status),
+                web.post("/tracks", self.get_tracks),
+                web.post("/albums", self.get_albums),
+                web.get("/search", self.search),
+                web.get("/users/{uid}/likes/tracks", self.liked_tracks),
+                web.get("/users/{uid}/playlists/list", self.playlists_list),
+                web.post("/users/{uid}/playlists/create", self.create_playlist),
+                web.get("/users/{uid}/playlists/{kind}", self.playlist),
+                web.post("/users/{uid}/playlists/{kind}/change", self.change_playlist),
+            ]
+        )
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Starts serving in the current event loop and returns the base URL."""
+
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        """Stops the server started with `start()`."""
+
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def main():
+    """Serves a seeded fake API until interrupted."""
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--tracks", type=int, default=1000)
+    parser.add_argument("--likes", type=int, default=10, help="liked tracks per user")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="seconds")
+    parser.add_argument("--token-rate", type=int, default=None, help="per second")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="0..1")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = FakeYandexMusic.from_args(args)
+    server.populate(args.users, args.tracks, likes_per_user=args.likes)
+    print(f"Fake Yandex Music on http://{args.host}:{args.port}, tokens token-1..")
+    web.run_app(server.make_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
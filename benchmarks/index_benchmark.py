@@ -0,0 +1,188 @@
+"""
+Measures the hot DB lookups before and after the secondary indexes are created.
+
+Fills a fresh database in a temporary directory with `--rows` Music rows
+(and users, groups and ratings in proportion), times each lookup without
+indexes, runs the index migration and times them again.
+
+    python -m benchmarks.index_benchmark --rows 1000000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import event, func, insert, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from bot.migrations import add_missing_indexes
+from bot.models import (
+    Base,
+    Group,
+    Music,
+    MusicRating,
+    User,
+    apply_sqlite_pragmas,
+    user_group_association,
+)
+
+INSERT_CHUNK_SIZE = 50_000
+
+
+def lookups(rnd: random.Random, users: int, groups: int, rows: int) -> dict:
+    """Returns {name: factory of a statement with random parameters}."""
+
+    return {
+        "group history": lambda: select(Music).where(
+            Music.group_id == rnd.randint(1, groups)
+        ),
+        "group track lookup": lambda: select(Music.id).where(
+            Music.group_id == rnd.randint(1, groups),
+            Music.type_of_music == "track",
+            Music.yandex_id == rnd.randint(1, rows),
+        ),
+        "group music state": lambda: select(
+            func.count(Music.id), func.max(Music.id), func.sum(Music.yandex_id)
+        ).where(
+            Music.group_id == rnd.randint(1, groups), Music.type_of_music == "track"
+        ),
+        "group members": lambda: select(User)
+        .join(user_group_association)
+        .where(user_group_association.c.group_id == rnd.randint(1, groups)),
+        "user history": lambda: select(Music).where(
+            Music.user_id == rnd.randint(1, users)
+        ),
+        "music ratings": lambda: select(
+            func.avg(MusicRating.rating), func.count(MusicRating.id)
+        ).where(MusicRating.music_id == rnd.randint(1, rows)),
+        "username lookup": lambda: select(User.id).where(
+            User.name == f"user{rnd.randint(1, users)}"
+        ),
+    }
+
+
+async def fill(connection, rnd: random.Random, users: int, groups: int, rows: int):
+    """Inserts random users, groups, shared music and ratings."""
+
+    async def insert_chunked(table, records):
+        for start in range(0, len(records), INSERT_CHUNK_SIZE):
+            await connection.execute(
+                insert(table), records[start : start + INSERT_CHUNK_SIZE]
+            )
+
+    await insert_chunked(
+        User, [{"id": n, "name": f"user{n}"} for n in range(1, users + 1)]
+    )
+    await insert_chunked(
+        Group,
+        [
+            {"id": n, "name": f"Group {n}", "creator_id": rnd.randint(1, users)}
+            for n in range(1, groups + 1)
+        ],
+    )
+    await insert_chunked(
+        user_group_association,
+        [
+            {"user_id": user_id, "group_id": group_id}
+            for group_id in range(1, groups + 1)
+            for user_id in rnd.sample(range(1, users + 1), 5)
+        ],
+    )
+    for start in range(1, rows + 1, INSERT_CHUNK_SIZE):
+        await connection.execute(
+            insert(Music),
+            [
+                {
+                    "id": n,
+                    "yandex_id": rnd.randint(1, rows),
+                    "title": f"Artist — Track {n}",
+                    "type_of_music": "track" if n % 5 else "album",
+                    "message": "",
+                    "photo_uri": "",
+                    "user_id": rnd.randint(1, users),
+                    "group_id": rnd.randint(1, groups),
+                }
+                for n in range(start, min(start + INSERT_CHUNK_SIZE, rows + 1))
+            ],
+        )
+    ratings = {(n % users + 1, rnd.randint(1, rows)) for n in range(rows // 5)}
+    await insert_chunked(
+        MusicRating,
+        [
+            {"user_id": user_id, "music_id": music_id, "rating": rnd.randint(1, 10)}
+            for user_id, music_id in ratings
+        ],
+    )
+
+
+async def time_lookups(connection, statements: dict, repeat: int) -> dict:
+    """Returns the average time of every lookup in milliseconds."""
+
+    timings = {}
+    for name, make_statement in statements.items():
+        started_at = time.monotonic()
+        for _ in range(repeat):
+            (await connection.execute(make_statement())).all()
+        timings[name] = (time.monotonic() - started_at) / repeat * 1000
+    return timings
+
+
+async def run(args):
+    """Times the lookups on a filled database before and after creating the indexes."""
+
+    rnd = random.Random(args.seed)
+    users, groups = max(args.rows // 100, 10), max(args.rows // 500, 2)
+
+    path = os.path.join(tempfile.mkdtemp(prefix="index_benchmark_"), "bench.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    event.listen(engine.sync_engine, "connect", apply_sqlite_pragmas)
+
+    try:
+        async with engine.begin() as connection:
+            # An existing database: tables without the secondary indexes
+            await connection.run_sync(Base.metadata.create_all)
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    await connection.run_sync(index.drop)
+
+            started_at = time.monotonic()
+            await fill(connection, rnd, users, groups, args.rows)
+            print(
+                f"{args.rows} Music rows, {users} users, {groups} groups "
+                f"loaded in {time.monotonic() - started_at:.1f} s"
+            )
+
+        statements = lookups(rnd, users, groups, args.rows)
+        async with engine.connect() as connection:
+            before = await time_lookups(connection, statements, args.repeat)
+
+        started_at = time.monotonic()
+        async with engine.begin() as connection:
+            await connection.run_sync(add_missing_indexes)
+        print(f"Indexes created in {time.monotonic() - started_at:.1f} s\n")
+
+        async with engine.connect() as connection:
+            after = await time_lookups(connection, statements, args.repeat)
+
+        print(f"{'lookup':<20} {'before, ms':>12} {'after, ms':>12}")
+        for name, elapsed in before.items():
+            print(f"{name:<20} {elapsed:12.2f} {after[name]:12.2f}")
+    finally:
+        await engine.dispose()
+
+
+def main():
+    """Parses the command line and runs the benchmark."""
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20, help="runs per lookup")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
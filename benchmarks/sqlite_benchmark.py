@@ -0,0 +1,123 @@
+"""
+Compares SQLite commit throughput with and without the bot's SQLite profile.
+
+For each profile a fresh database in a temporary directory gets:
+
+    sequential  one Music row per commit, like sharing a track
+    concurrent  `--writers` tasks committing and `--readers` tasks loading a group
+                history at the same time, like the sync job next to user requests
+
+    python -m benchmarks.sqlite_benchmark --commits 2000 --writers 4 --readers 8
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy import event, select, exc
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from bot.models import Base, Music, SQLITE_PRAGMAS, apply_sqlite_pragmas
+
+PROFILES = {
+    # SQLite defaults: rollback journal, full fsync on commit, no busy timeout
+    "default": {"busy_timeout": 0},
+    "tuned": SQLITE_PRAGMAS,
+}
+
+
+def make_music(n: int) -> Music:
+    """Builds the n-th shared track written by the benchmark."""
+
+    return Music(
+        yandex_id=n,
+        title=f"Artist — Track {n}",
+        type_of_music="track",
+        message="",
+        photo_uri="",
+        user_id=1,
+        group_id=n % 10,
+    )
+
+
+async def run_profile(name: str, pragmas: dict, args) -> None:
+    """Measures commits and concurrent reads on a new database with these pragmas."""
+
+    path = os.path.join(tempfile.mkdtemp(prefix="sqlite_benchmark_"), "bench.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    event.listen(
+        engine.sync_engine,
+        "connect",
+        lambda dbapi_connection, _: apply_sqlite_pragmas(
+            dbapi_connection, None, pragmas
+        ),
+    )
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+    started_at = time.monotonic()
+    for n in range(args.commits):
+        async with session_factory.begin() as session:
+            session.add(make_music(n))
+    elapsed = time.monotonic() - started_at
+    print(f"{name:>8} sequential: {args.commits / elapsed:8.0f} commits/s")
+
+    counters = {"commits": 0, "reads": 0, "locked": 0}
+    deadline = time.monotonic() + args.seconds
+
+    async def writer(offset: int):
+        n = args.commits + offset
+        while time.monotonic() < deadline:
+            try:
+                async with session_factory.begin() as session:
+                    session.add(make_music(n))
+                counters["commits"] += 1
+            except exc.OperationalError:
+                counters["locked"] += 1
+            n += args.writers
+
+    async def reader():
+        while time.monotonic() < deadline:
+            try:
+                async with session_factory() as session:
+                    await session.scalars(select(Music).where(Music.group_id == 1))
+                counters["reads"] += 1
+            except exc.OperationalError:
+                counters["locked"] += 1
+
+    await asyncio.gather(
+        *(writer(offset) for offset in range(args.writers)),
+        *(reader() for _ in range(args.readers)),
+    )
+    print(
+        f"{name:>8} concurrent: {counters['commits'] / args.seconds:8.0f} commits/s, "
+        f"{counters['reads'] / args.seconds:6.0f} reads/s, "
+        f"{counters['locked']} 'database is locked' errors"
+    )
+    await engine.dispose()
+
+
+async def run(args):
+    """Runs the benchmark for every SQLite profile."""
+
+    for name, pragmas in PROFILES.items():
+        await run_profile(name, pragmas, args)
+
+
+def main():
+    """Parses the command line and runs the benchmark."""
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--commits", type=int, default=1000)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Measures the playlist sync job against the local Yandex Music stand-in.
+
+Seeds a fresh database in a temporary directory with `--groups` groups of
+`--members` users each, every member sharing `--shared` tracks, then runs
+`playlist_update_job` three times:
+
+    cold     every playlist is filled from scratch
+    warm     nothing changed, so nothing should be written
+    changed  every member added one track to their playlist in Yandex Music
+
+    python -m benchmarks.sync_benchmark --groups 20 --members 5 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks.fake_yandex_music import FakeYandexMusic
+
+
+async def seed_groups(args, server: FakeYandexMusic, tokens: list[str]) -> None:
+    """Creates the users and groups with their shared tracks and empty playlists."""
+
+    # pylint: disable=C0415
+    from bot.client_pool import client_pool
+    from bot.utils import database
+
+    for n, token in enumerate(tokens, start=1):
+        await database.insert_user(n, f"user{n}")
+        await database.update_user_token(n, token)
+
+    catalog = list(server.tracks.values())
+    for group_index in range(args.groups):
+        member_ids = range(
+            group_index * args.members + 1, (group_index + 1) * args.members + 1
+        )
+        await database.create_group(f"Group {group_index + 1}", member_ids[0])
+        group_id = (await database.get_user_groups(member_ids[0]))[-1].id
+
+        for user_id in member_ids:
+            if user_id != member_ids[0]:
+                await database.add_user_to_group(group_id, f"user{user_id}")
+            for track in server.random.sample(catalog, args.shared):
+                await database.insert_music(
+                    yandex_id=int(track["id"]),
+                    title=f"{track['artists'][0]['name']} — {track['title']}",
+                    type_of_music="track",
+                    message="",
+                    photo_uri=track["coverUri"],
+                    user_id=user_id,
+                    group_id=group_id,
+                    album_id=track["albums"][0]["id"],
+                    artists=[artist["name"] for artist in track["artists"]],
+                )
+
+            client = await client_pool.get(user_id, tokens[user_id - 1])
+            playlist = await client.users_playlists_create(f"Group {group_id}")
+            await database.create_playlist_for_user_in_group(
+                user_id, group_id, playlist.kind, playlist.owner.uid
+            )
+
+
+def add_track_in_yandex_music(server: FakeYandexMusic) -> None:
+    """Adds a random track to every playlist, as if its owner did it in the app."""
+
+    catalog = list(server.tracks.values())
+    for playlist in server.playlists():
+        track = server.random.choice(catalog)
+        playlist["tracks"].append({"id": track["id"], "albumId": None})
+        playlist["trackCount"] += 1
+        playlist["revision"] += 1
+
+
+async def run(args):
+    """Seeds the database and times the cold, warm and changed sync passes."""
+
+    server = FakeYandexMusic.from_args(args)
+    tokens = server.populate(args.groups * args.members, args.tracks, likes_per_user=0)
+    base_url = await server.start(port=args.port)
+
+    # Settings and the DB location are read on import
+    os.environ["YANDEX_API_URL"] = base_url
+    os.chdir(tempfile.mkdtemp(prefix="sync_benchmark_"))
+    # pylint: disable=C0415
+    from bot.music import playlist_update_job
+    from bot.request_governor import governor
+    from bot.utils import database
+
+    await database.migrate()
+    await seed_groups(args, server, tokens)
+
+    print(
+        f"{args.groups} groups x {args.members} members, "
+        f"{args.shared} shared tracks per member, latency {args.latency} s"
+    )
+    for name, prepare in (
+        ("cold", None),
+        ("warm", None),
+        ("changed", add_track_in_yandex_music),
+    ):
+        if prepare:
+            prepare(server)
+        requests_before = sum(server.requests.values())
+        started_at = time.monotonic()
+        await playlist_update_job(None)
+        print(
+            f"{name:>8}: {time.monotonic() - started_at:7.2f} s, "
+            f"{sum(server.requests.values()) - requests_before:6d} requests"
+        )
+
+    print("Requests by endpoint:", server.requests)
+    print("Governor:", governor.stats())
+    await server.stop()
+    await database.close()
+
+
+def main():
+    """Parses the command line and runs the benchmark."""
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--groups", type=int, default=10)
+    parser.add_argument("--members", type=int, default=4)
+    parser.add_argument("--shared", type=int, default=10, help="tracks per member")
+    parser.add_argument("--tracks", type=int, default=5000, help="catalog size")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="seconds")
+    parser.add_argument("--token-rate", type=int, default=None, help="per second")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="0..1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    In-process LRU cache whose entries also expire `ttl` seconds after being set.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+
+    def get(self, key, default=None):
+        """Returns the cached value, or `default` if it is missing or expired."""
+
+        entry = self._entries.get(key, _MISSING)
+        if entry is _MISSING:
+            return default
+
+        value, expires_at = entry
+        if time.monotonic() > expires_at:
+            del self._entries[key]
+            return default
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value) -> None:
+        """Stores the value, evicting the least recently used entries if needed."""
+
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def pop(self, key) -> None:
+        """Drops the entry if it is cached."""
+
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Drops all entries."""
+
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
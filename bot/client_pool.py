@@ -0,0 +1,142 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from yandex_music import ClientAsync
+
+from bot.request_governor import GovernedRequest, governor
+from bot.settings import (
+    YANDEX_API_URL,
+    CLIENT_POOL_SIZE,
+    CLIENT_POOL_TTL,
+    BREAKER_THRESHOLD,
+    BREAKER_BACKOFF_BASE,
+    BREAKER_BACKOFF_MAX,
+)
+
+
+class ClientPool:
+    """
+    Keeps initialised Yandex Music clients keyed by user id, so that `init()`
+    (an account status round trip) is done once per token instead of once per call.
+
+    Entries expire after `ttl` seconds, the least recently used entry is evicted
+    when the pool is full, and an entry is dropped as soon as the user's token changes.
+    """
+
+    def __init__(self, max_size: int = CLIENT_POOL_SIZE, ttl: float = CLIENT_POOL_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clients = OrderedDict()  # user_id -> (token, client, created_at)
+        self._locks = {}
+
+    def _get_fresh(self, user_id: int, token: str) -> ClientAsync | None:
+        """Returns a cached client if it was created for this token and has not expired."""
+
+        entry = self._clients.get(user_id)
+        if entry is None:
+            return None
+
+        cached_token, client, created_at = entry
+        if cached_token != token or time.monotonic() - created_at > self.ttl:
+            del self._clients[user_id]
+            return None
+
+        self._clients.move_to_end(user_id)
+        return client
+
+    async def get(self, user_id: int, token: str) -> ClientAsync:
+        """
+        Returns an initialised client for the user, creating it if necessary.
+        Raises `YandexMusicError` if the token is rejected by Yandex Music.
+        """
+
+        client = self._get_fresh(user_id, token)
+        if client is not None:
+            return client
+
+        # Concurrent callers for the same user wait for a single init()
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            client = self._get_fresh(user_id, token)
+            if client is not None:
+                return client
+
+            client = await ClientAsync(
+                token, base_url=YANDEX_API_URL, request=GovernedRequest(governor)
+            ).init()
+
+            self._clients[user_id] = (token, client, time.monotonic())
+            while len(self._clients) > self.max_size:
+                evicted_user_id, _ = self._clients.popitem(last=False)
+                self._locks.pop(evicted_user_id, None)
+
+        return client
+
+    def invalidate(self, user_id: int) -> None:
+        """Drops the cached client of the user (e.g. after the token was updated)."""
+
+        self._clients.pop(user_id, None)
+
+    def clear(self) -> None:
+        """Drops all cached clients."""
+
+        self._clients.clear()
+        self._locks.clear()
+
+
+class CircuitBreaker:
+    """
+    Per-user circuit breaker for Yandex Music tokens.
+
+    After `threshold` consecutive authorization failures the user's circuit opens and
+    the user is skipped. Once the backoff (doubled on every failed retry, up to
+    `backoff_max`) has passed, the circuit is half-open: the next attempt is let
+    through, and it either closes the circuit or opens it again.
+    """
+
+    def __init__(
+        self,
+        threshold: int = BREAKER_THRESHOLD,
+        backoff_base: float = BREAKER_BACKOFF_BASE,
+        backoff_max: float = BREAKER_BACKOFF_MAX,
+    ):
+        self.threshold = threshold
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._failures = {}  # user_id -> consecutive authorization failures
+        self._retry_at = {}  # user_id -> time when the open circuit becomes half-open
+
+    def is_open(self, user_id: int) -> bool:
+        """Checks if the user's token is considered broken right now."""
+
+        retry_at = self._retry_at.get(user_id)
+        return retry_at is not None and time.monotonic() < retry_at
+
+    def record_failure(self, user_id: int) -> None:
+        """Counts an authorization failure and opens the circuit if needed."""
+
+        failures = self._failures.get(user_id, 0) + 1
+        self._failures[user_id] = failures
+
+        if failures >= self.threshold:
+            backoff = min(
+                self.backoff_max,
+                self.backoff_base * 2 ** (failures - self.threshold),
+            )
+            self._retry_at[user_id] = time.monotonic() + backoff
+
+    def record_success(self, user_id: int) -> None:
+        """Closes the user's circuit."""
+
+        self._failures.pop(user_id, None)
+        self._retry_at.pop(user_id, None)
+
+    def reset(self, user_id: int) -> None:
+        """Closes the user's circuit (e.g. after the token was updated)."""
+
+        self.record_success(user_id)
+
+
+client_pool = ClientPool()
+circuit_breaker = CircuitBreaker()
@@ -3,7 +3,8 @@ import logging
 import telegram
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, User
 
-from bot.utils import database, send_or_edit_message
+from bot.client_pool import client_pool, circuit_breaker
+from bot.utils import database, rating_queue, send_or_edit_message
 from bot.constants import State, CallbackData
 
 logger = logging.getLogger(__name__)
@@ -11,14 +12,13 @@ logger = logging.getLogger(__name__)
 
 async def start_handler(update: Update, _) -> int:
     """
-    Handles the /start command. Initializes the bot, creates database tables,
-    and inserts the user into the database. Displays a menu with options.
+    Handles the /start command. Inserts the user into the database and
+    displays a menu with options.
     """
 
     user = update.effective_user
     logger.info("User %d - %s started the bot.", user.id, user.name)
-    database.create_tables()
-    database.insert_user(user.id, user.name)
+    await database.insert_user(user.id, user.name)
 
     keyboard = [
         [
@@ -101,7 +101,9 @@ async def receive_token_handler(update: Update, _) -> int:
 
     user_message = update.message.text
 
-    database.update_user_token(user.id, user_message)
+    await database.update_user_token(user.id, user_message)
+    client_pool.invalidate(user.id)
+    circuit_breaker.reset(user.id)
 
     keyboard = [
         [
@@ -130,7 +132,8 @@ async def account_handler(update: Update, _) -> None:
     user = update.effective_user
     logger.info('User %d in "token_handler"', user.id)
 
-    result = database.get_user_statistic(user.id)
+    await rating_queue.flush_user(user.id)
+    result = await database.get_user_statistic(user.id)
 
     token = "✔️" if result.get("token") else "❌"
 
@@ -168,12 +171,12 @@ async def account_handler(update: Update, _) -> None:
     return State.START.value
 
 
-def group_selection(user: User, cl_data: str) -> InlineKeyboardMarkup:
+async def group_selection(user: User, cl_data: str) -> InlineKeyboardMarkup:
     """
     Creates an inline keyboard markup for selecting a group.
     """
 
-    groups = database.get_user_groups(user.id)
+    groups = await database.get_user_groups(user.id)
 
     keyboard = []
     for group in groups:
@@ -24,7 +24,7 @@ from bot.group_management import (
 )
 from bot.history import (
     history_handler,
-    carousel_navigation_handler,
+    history_navigation_handler,
     group_history_list_handler,
     group_history_carousel_handler,
     display_my_history_list_handler,
@@ -201,9 +201,7 @@ main_conversation = ConversationHandler(
                 display_my_history_carousel_handler,
                 pattern="^" + str(CallbackData.MY_HISTORY_COR.value) + "$",
             ),
-            CallbackQueryHandler(
-                carousel_navigation_handler, pattern="^(prev|next)_\\d+$"
-            ),
+            CallbackQueryHandler(history_navigation_handler, pattern="^history_"),
             CallbackQueryHandler(
                 group_history_list_handler,
                 pattern="^" + str(CallbackData.GROUP_HISTORY.value) + "$",
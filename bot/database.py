@@ -1,334 +1,503 @@
-from sqlalchemy import (
-    create_engine,
-    Column,
-    Integer,
-    String,
-    ForeignKey,
-    Table,
-    Float,
-    UniqueConstraint,
+import asyncio
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from sqlalchemy import Integer, Float, func, cast, tuple_, select, update, delete
+from sqlalchemy.orm import selectinload
+
+from bot.cache import TTLCache
+from bot.migrations import apply_migrations
+from bot.models import (
+    engine,
+    lock_engine,
+    upsert,
+    Session,
+    user_group_association,
+    User,
+    Group,
+    UserGroupPlaylist,
+    Music,
+    MusicRating,
+    MusicMetadata,
 )
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from bot.ratings import apply_rating, rebuild_rating_aggregates
+from bot.settings import HISTORY_PAGE_SIZE, IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL
 
-DATABASE_PATH = "sqlite:///Database.db"
+logger = logging.getLogger(__name__)
 
-engine = create_engine(DATABASE_PATH)
-Session = sessionmaker(bind=engine)
-session = Session()
 
-Base = declarative_base()
+def dump_artists(artists: list[str] | None) -> str | None:
+    """Serializes artist names for the `artists` columns."""
+    return json.dumps(artists, ensure_ascii=False) if artists else None
 
-# Table for connecting users and groups (many-to-many relationship)
-user_group_association = Table(
-    "user_group_association",
-    Base.metadata,
-    Column("user_id", Integer, ForeignKey("Users.id"), primary_key=True),
-    Column("group_id", Integer, ForeignKey("Group.id"), primary_key=True),
-)
-
-
-class User(Base):
-    """
-    Represents a user.
-
-    Relationships:
-        ratings: List of ratings the user gave.
-        groups: Groups the user belongs to.
-        shared_music: Music shared by the user.
-        group_playlists: Playlist info per group.
-    """
-
-    __tablename__ = "Users"
-
-    id = Column(Integer, primary_key=True)  # Telegram user.id
-    name = Column(String, nullable=False)  # Telegram username
-    token = Column(String, nullable=True)  # Yandex Music token
-    count_of_sharing = Column(Integer, default=0)
-    count_of_ratings = Column(Integer, default=0)
-
-    ratings = relationship("MusicRating", back_populates="user")
-    groups = relationship(
-        "Group", secondary=user_group_association, back_populates="users"
-    )
-    shared_music = relationship("Music", back_populates="shared_by")
-    group_playlists = relationship("UserGroupPlaylist", back_populates="user")
-
-
-class Group(Base):
-    """
-    Represents a group of users.
-
-    Relationships:
-        users: Members of the group.
-        music: Shared music in the group.
-        user_playlists: Playlist info per user in this group.
-    """
-
-    __tablename__ = "Group"
 
-    id = Column(Integer, primary_key=True)
-    name = Column(String, nullable=False)
-    creator_id = Column(Integer, ForeignKey("Users.id"), nullable=False)
-
-    users = relationship(
-        "User", secondary=user_group_association, back_populates="groups"
-    )
-    music = relationship("Music", back_populates="group")
-    user_playlists = relationship("UserGroupPlaylist", back_populates="group")
-
-
-class UserGroupPlaylist(Base):
-    """
-    Stores Yandex Music playlist info for each user in a group.
-    First of all, it is necessary to save playlist_kind for each user in each group.
-
-    Relationships:
-        user: Related User object.
-        group: Related Group object.
-    """
-
-    __tablename__ = "UserGroupPlaylist"
-
-    user_id = Column(Integer, ForeignKey("Users.id"), primary_key=True)
-    group_id = Column(Integer, ForeignKey("Group.id"), primary_key=True)
-    uid = Column(Integer, nullable=False)
-    kind = Column(String, nullable=False)
-
-    user = relationship("User", back_populates="group_playlists")
-    group = relationship("Group", back_populates="user_playlists")
-
-
-class Music(Base):
-    """
-    Represents a track or album shared by a user.
-
-    Relationships:
-        shared_by: User who shared the music.
-        group: Group where it was shared.
-        ratings: Ratings given to this music.
-    """
-
-    __tablename__ = "Music"
-
-    id = Column(Integer, primary_key=True)
-    yandex_id = Column(Integer, nullable=False)  # Yandex Music track id
-    title = Column(String, nullable=False)  # Artist and title of music
-    type_of_music = Column(String, nullable=False)  # Track or album
-    message = Column(String, nullable=False)  # Text from user
-    photo_uri = Column(String, nullable=False)
-    average_mark = Column(Float, default=0)
-    count_of_ratings = Column(Integer, default=0)
-
-    ratings = relationship("MusicRating", back_populates="music")
-
-    user_id = Column(Integer, ForeignKey("Users.id"))
-    shared_by = relationship("User", back_populates="shared_music")
-
-    group_id = Column(Integer, ForeignKey("Group.id"))
-    group = relationship("Group", back_populates="music")
-
-
-class MusicRating(Base):
+class Database:
     """
-    Represents a rating given by a user to a specific piece of music.
-    There is a unique constraint on (user_id, music_id) — one rating per user per music.
+    Main class for all database operations.
+    Every method runs in its own short-lived async session.
 
-    Relationships:
-        user: Who rated.
-        music: What was rated.
+    Usernames, group names and group members are cached in memory for
+    rendering; the methods that change them drop the cached entries. Other
+    processes sharing the database can't, so the entries expire sooner there.
     """
 
-    __tablename__ = "MusicRating"
-
-    id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("Users.id"), nullable=False)
-    music_id = Column(Integer, ForeignKey("Music.id"), nullable=False)
-    rating = Column(Integer, nullable=False)
-
-    user = relationship("User")
-    music = relationship("Music")
-
-    __table_args__ = (
-        UniqueConstraint("user_id", "music_id", name="unique_user_music_rating"),
-    )
-
+    def __init__(self):
+        self.usernames = TTLCache(IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL)
+        self.group_names = TTLCache(IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL)
+        self.groups_with_users = TTLCache(IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL)
+        self._locks = {}  # name -> asyncio.Lock, see lock()
+
+    def _forget_group(self, group_id: int) -> None:
+        """Drops the cached name and members of the group."""
+        self.group_names.pop(group_id)
+        self.groups_with_users.pop(group_id)
+
+    async def close(self) -> None:
+        """Closes all pooled DB connections."""
+        await engine.dispose()
+        if lock_engine is not None:
+            await lock_engine.dispose()
+
+    @asynccontextmanager
+    async def lock(self, name: str):
+        """
+        Holds a named lock across all bot processes sharing the database.
+        On PostgreSQL it is an advisory lock held by a transaction until the
+        block exits, on a connection opened for it outside the pool, so the
+        block can use as many pooled connections as it needs. The in-process
+        lock is taken first, so a process waits on one connection per name;
+        SQLite is used by a single process, where it is enough.
+        """
+        async with self._locks.setdefault(name, asyncio.Lock()):
+            if lock_engine is None:
+                yield
+                return
 
-class Database:
-    """Main class for all database operations."""
+            async with lock_engine.begin() as connection:
+                await connection.execute(
+                    select(func.pg_advisory_xact_lock(func.hashtext(name)))
+                )
+                yield
 
-    def create_tables(self) -> None:
-        """Creates all tables in the DB if they don`t exist."""
-        Base.metadata.create_all(engine)
+    async def migrate(self) -> list[int]:
+        """Applies the pending schema migrations, see bot.migrations."""
+        return await apply_migrations(self)
 
     # User functions
 
-    def insert_user(self, user_id: int, user_name: str):
+    async def insert_user(self, user_id: int, user_name: str):
         """Adds a new user if not exists."""
-        user = session.query(User).filter(User.id == user_id).first()
-        if not user:
-            session.add(User(id=user_id, name=user_name))
-            session.commit()
+        async with Session.begin() as session:
+            if await session.get(User, user_id) is None:
+                session.add(User(id=user_id, name=user_name))
 
-    def update_user_token(self, user_id: int, new_token: str):
+    async def update_user_token(self, user_id: int, new_token: str):
         """Updates user's Yandex Music token."""
-        user = session.query(User).filter(User.id == user_id).first()
-        user.token = new_token
-        session.commit()
+        async with Session.begin() as session:
+            await session.execute(
+                update(User).where(User.id == user_id).values(token=new_token)
+            )
 
-    def get_user_statistic(self, user_id: int) -> dict:
+    async def get_user_statistic(self, user_id: int) -> dict:
         """
-        Returns user statistics:
+        Returns user statistics in one query:
         whether there is a token, number of shared links, ratings, and average scores.
         """
-        user = session.query(User).filter(User.id == user_id).first()
-        return {
-            "token": user.token is not None,
-            "count_of_sharing": user.count_of_sharing,
-            "count_of_ratings": user.count_of_ratings,
-            "score_of_shared_music": self.get_average_score_of_shared_music(user_id),
-            "score_of_rated_music": self.get_average_score_of_rated_music(user_id),
-        }
+        async with Session() as session:
+            result = await session.execute(
+                select(
+                    User.token.is_not(None).label("token"),
+                    User.count_of_sharing,
+                    User.count_of_ratings,
+                    (
+                        User.sum_of_shared_marks
+                        / func.nullif(User.count_of_rated_shared, 0)
+                    ).label("score_of_shared_music"),
+                    (
+                        cast(User.sum_of_ratings, Float)
+                        / func.nullif(User.count_of_ratings, 0)
+                    ).label("score_of_rated_music"),
+                ).where(User.id == user_id)
+            )
+            statistic = result.one()._asdict()
 
-    def get_user_groups(self, user_id: int):
+        statistic["token"] = bool(statistic["token"])
+        if statistic["score_of_shared_music"] is None:
+            statistic["score_of_shared_music"] = "Пока никто не оценил"
+        if statistic["score_of_rated_music"] is None:
+            statistic["score_of_rated_music"] = "Пока вы не оценивали"
+        return statistic
+
+    async def get_user_groups(self, user_id: int):
         """Returns all groups user belongs to."""
-        user = session.query(User).filter(User.id == user_id).first()
-        return user.groups
+        async with Session() as session:
+            result = await session.scalars(
+                select(Group)
+                .join(user_group_association)
+                .where(user_group_association.c.user_id == user_id)
+                .order_by(Group.id)
+            )
+            return result.all()
+
+    async def get_user_groups_with_users(self, user_id: int):
+        """
+        Returns all groups user belongs to with their members loaded, in two
+        queries however many groups there are.
+        """
+        async with Session() as session:
+            result = await session.scalars(
+                select(Group)
+                .join(user_group_association)
+                .where(user_group_association.c.user_id == user_id)
+                .options(selectinload(Group.users))
+                .order_by(Group.id)
+            )
+            return result.all()
 
-    def check_username(self, username: str) -> bool:
+    async def check_username(self, username: str) -> bool:
         """Checks if username exists."""
-        user = session.query(User).filter(User.name == username).first()
-        return bool(user)
+        async with Session() as session:
+            user = await session.scalar(select(User.id).where(User.name == username))
+        return user is not None
 
-    def get_token(self, user_id: int) -> str:
+    async def get_token(self, user_id: int) -> str:
         """Gets user`s Yandex Music token."""
-        user = session.query(User).filter(User.id == user_id).first()
-        return user.token
+        async with Session() as session:
+            return await session.scalar(select(User.token).where(User.id == user_id))
 
-    def incr_count_of_sharing(self, user_id: int) -> None:
+    async def incr_count_of_sharing(self, user_id: int) -> None:
         """Increments number of shared items."""
-        user = session.query(User).filter(User.id == user_id).first()
-        user.count_of_sharing += 1
-
-    def get_user_sharing(self, user_id: int):
-        """Returns all music shared by user."""
-        user = session.query(User).filter(User.id == user_id).first()
-        return user.shared_music
+        async with Session.begin() as session:
+            await session.execute(
+                update(User)
+                .where(User.id == user_id)
+                .values(count_of_sharing=User.count_of_sharing + 1)
+            )
 
-    def get_username(self, user_id: int) -> str:
+    async def get_username(self, user_id: int) -> str:
         """Returns username by ID."""
-        user = session.query(User).filter(User.id == user_id).first()
-        return str(user.name)
-
-    def get_all_users(self):
-        """Returns all users in DB."""
-        return session.query(User).all()
+        name = self.usernames.get(user_id)
+        if name is None:
+            async with Session() as session:
+                name = await session.scalar(select(User.name).where(User.id == user_id))
+            if name is not None:
+                self.usernames.set(user_id, name)
+        return str(name)
 
     # Group functions
 
-    def create_group(self, name: str, user_id: int):
+    async def create_group(self, name: str, user_id: int):
         """Creates a new group and adds creator as member."""
-        group = Group(name=name, creator_id=user_id)
-        user = session.query(User).filter(User.id == user_id).first()
-        group.users = [user]
-        session.add(group)
-        session.commit()
+        async with Session.begin() as session:
+            group = Group(name=name, creator_id=user_id)
+            session.add(group)
+            await session.flush()
+            await session.execute(
+                user_group_association.insert().values(
+                    user_id=user_id, group_id=group.id
+                )
+            )
+        # SQLite may reuse the id of the last deleted group
+        self._forget_group(group.id)
 
-    def get_group_name(self, group_id: int) -> str | None:
+    async def get_group_name(self, group_id: int) -> str | None:
         """Returns group name by ID."""
-        group = session.query(Group).filter(Group.id == group_id).first()
-        return str(group.name) if group else None
-
-    def delete_group(self, user_id: int, group_id: int):
+        name = self.group_names.get(group_id)
+        if name is None:
+            async with Session() as session:
+                name = await session.scalar(
+                    select(Group.name).where(Group.id == group_id)
+                )
+            if name is not None:
+                self.group_names.set(group_id, name)
+        return str(name) if name is not None else None
+
+    async def load_display_names(self, user_ids, group_ids) -> None:
+        """
+        Caches the names of the given users and groups that are not cached yet,
+        in at most two queries, so that rendering a page of music does not
+        query them one by one.
+        """
+        user_ids = {
+            user_id
+            for user_id in user_ids
+            if user_id is not None and self.usernames.get(user_id) is None
+        }
+        group_ids = {
+            group_id
+            for group_id in group_ids
+            if group_id is not None and self.group_names.get(group_id) is None
+        }
+        if not user_ids and not group_ids:
+            return
+
+        async with Session() as session:
+            if user_ids:
+                result = await session.execute(
+                    select(User.id, User.name).where(User.id.in_(user_ids))
+                )
+                for user_id, name in result:
+                    self.usernames.set(user_id, name)
+            if group_ids:
+                result = await session.execute(
+                    select(Group.id, Group.name).where(Group.id.in_(group_ids))
+                )
+                for group_id, name in result:
+                    self.group_names.set(group_id, name)
+
+    async def delete_group(self, user_id: int, group_id: int):
         """
         Deletes a group and all its related data if the user is the creator,
         or removes the user from the group if they are not the creator.
         """
-        group = session.query(Group).filter(Group.id == group_id).first()
-
-        if group.creator_id == user_id:
-            session.query(UserGroupPlaylist).filter_by(group_id=group_id).delete()
-            group.users.clear()
-            session.delete(group)
-        else:
-            user = session.query(User).get(user_id)
-            user.groups.remove(group)
-            session.query(UserGroupPlaylist).filter_by(
-                user_id=user_id, group_id=group_id
-            ).delete()
-
-        session.commit()
-
-    def get_group_users(self, group_id: int):
+        async with Session.begin() as session:
+            group = await session.get(Group, group_id)
+
+            if group.creator_id == user_id:
+                await session.execute(
+                    delete(UserGroupPlaylist).where(
+                        UserGroupPlaylist.group_id == group_id
+                    )
+                )
+                await session.execute(
+                    delete(user_group_association).where(
+                        user_group_association.c.group_id == group_id
+                    )
+                )
+                # Shared music stays in the users' history without a group
+                await session.execute(
+                    update(Music)
+                    .where(Music.group_id == group_id)
+                    .values(group_id=None)
+                )
+                await session.delete(group)
+            else:
+                await session.execute(
+                    delete(user_group_association).where(
+                        user_group_association.c.user_id == user_id,
+                        user_group_association.c.group_id == group_id,
+                    )
+                )
+                await session.execute(
+                    delete(UserGroupPlaylist).where(
+                        UserGroupPlaylist.user_id == user_id,
+                        UserGroupPlaylist.group_id == group_id,
+                    )
+                )
+        self._forget_group(group_id)
+
+    async def get_all_groups(self):
+        """Returns all groups in DB."""
+        async with Session() as session:
+            return (await session.scalars(select(Group))).all()
+
+    async def get_group_with_users(self, group_id: int):
+        """Returns the group with its members loaded, or None."""
+        group = self.groups_with_users.get(group_id)
+        if group is None:
+            async with Session() as session:
+                group = await session.get(
+                    Group, group_id, options=[selectinload(Group.users)]
+                )
+            if group is not None:
+                self.groups_with_users.set(group_id, group)
+        return group
+
+    async def get_group_users(self, group_id: int):
         """Returns list of users in a group."""
-        group = session.query(Group).filter(Group.id == group_id).first()
-        return group.users
+        async with Session() as session:
+            result = await session.scalars(
+                select(User)
+                .join(user_group_association)
+                .where(user_group_association.c.group_id == group_id)
+            )
+            return result.all()
 
-    def add_user_to_group(self, group_id: int, user_name: str):
+    async def add_user_to_group(self, group_id: int, user_name: str):
         """Adds a user to the group by username."""
-        group = session.query(Group).filter(Group.id == group_id).first()
-        user = session.query(User).filter(User.name == user_name).first()
-        group.users.extend([user])
-        session.commit()
+        async with Session.begin() as session:
+            user_id = await session.scalar(
+                select(User.id).where(User.name == user_name)
+            )
+            await session.execute(
+                user_group_association.insert().values(
+                    user_id=user_id, group_id=group_id
+                )
+            )
+        self.groups_with_users.pop(group_id)
 
-    def get_group_sharing(self, group_id: int):
+    async def get_group_sharing(self, group_id: int):
         """Returns all music shared in the group."""
-        group = session.query(Group).filter(Group.id == group_id).first()
-        return group.music
+        async with Session() as session:
+            result = await session.scalars(
+                select(Music).where(Music.group_id == group_id).order_by(Music.id)
+            )
+            return result.all()
+
+    async def get_sharing_page(
+        self,
+        *,
+        user_id: int | None = None,
+        group_id: int | None = None,
+        after_id: int | None = None,
+        before_id: int | None = None,
+        limit: int = HISTORY_PAGE_SIZE,
+    ) -> tuple[list, bool, bool]:
+        """
+        Returns a page of music shared by the user or in the group, ordered by id,
+        and whether there is music before and after it.
 
-    def delete_track(self, track_id: int):
-        """Deletes a track."""
-        track = session.query(Music).get(track_id)
+        The page is located by the id of its neighbour instead of an offset:
+        `after_id` for the next page, `before_id` for the previous one, neither
+        for the first one.
+        """
+        if user_id is not None:
+            owner = Music.user_id == user_id
+        else:
+            owner = Music.group_id == group_id
+
+        statement = select(Music).where(owner).limit(limit)
+        if before_id is not None:
+            statement = statement.where(Music.id < before_id).order_by(Music.id.desc())
+        elif after_id is not None:
+            statement = statement.where(Music.id > after_id).order_by(Music.id)
+        else:
+            statement = statement.order_by(Music.id)
+
+        async with Session() as session:
+            page = list((await session.scalars(statement)).all())
+            if not page:
+                return page, False, False
+            if before_id is not None:
+                page.reverse()
+
+            result = await session.execute(
+                select(
+                    select(Music.id).where(owner, Music.id < page[0].id).exists(),
+                    select(Music.id).where(owner, Music.id > page[-1].id).exists(),
+                )
+            )
+            has_previous, has_next = result.one()
+        return page, has_previous, has_next
 
-        session.query(MusicRating).filter_by(music_id=track_id).delete()
-        session.delete(track)
-        session.commit()
+    async def get_group_music_state(self, group_id: int) -> str:
+        """
+        Returns a cheap fingerprint of the group's tracks: their count, the latest id
+        and the sum of Yandex IDs. It changes whenever tracks are added or deleted.
+        """
+        async with Session() as session:
+            result = await session.execute(
+                select(
+                    func.count(Music.id), func.max(Music.id), func.sum(Music.yandex_id)
+                ).where(Music.group_id == group_id, Music.type_of_music == "track")
+            )
+            count, last_id, yandex_ids_sum = result.one()
+        return f"{count}:{last_id}:{yandex_ids_sum}"
+
+    async def delete_track(self, track_id: int):
+        """Deletes a track and takes its ratings out of the users' aggregates."""
+        async with Session.begin() as session:
+            music = await session.get(Music, track_id)
+            if music.count_of_ratings:
+                await session.execute(
+                    update(User)
+                    .where(User.id == music.user_id)
+                    .values(
+                        count_of_rated_shared=User.count_of_rated_shared - 1,
+                        sum_of_shared_marks=User.sum_of_shared_marks
+                        - music.average_mark,
+                    )
+                )
+
+            ratings = await session.execute(
+                select(MusicRating.user_id, MusicRating.rating).where(
+                    MusicRating.music_id == track_id
+                )
+            )
+            for user_id, rating in ratings.all():
+                await session.execute(
+                    update(User)
+                    .where(User.id == user_id)
+                    .values(
+                        count_of_ratings=User.count_of_ratings - 1,
+                        sum_of_ratings=User.sum_of_ratings - rating,
+                    )
+                )
+
+            await session.execute(
+                delete(MusicRating).where(MusicRating.music_id == track_id)
+            )
+            await session.execute(delete(Music).where(Music.id == track_id))
 
     # UserGroupPlaylist functions
 
-    def create_playlist_for_user_in_group(
+    async def create_playlist_for_user_in_group(
         self, user_id: int, group_id: int, playlist_kind: str, uid: int
     ):
         """Saves Yandex Music playlist info for a user in a group."""
-        session.add(
-            UserGroupPlaylist(
-                user_id=user_id, group_id=group_id, kind=playlist_kind, uid=uid
+        async with Session.begin() as session:
+            session.add(
+                UserGroupPlaylist(
+                    user_id=user_id,
+                    group_id=group_id,
+                    kind=str(playlist_kind),
+                    uid=uid,
+                )
             )
-        )
-        session.commit()
 
-    def get_playlist(self, user_id: int, group_id: int):
+    async def get_playlist(self, user_id: int, group_id: int):
         """Gets playlist info for a user in a group."""
-        return (
-            session.query(UserGroupPlaylist)
-            .filter(
-                UserGroupPlaylist.user_id == user_id,
-                UserGroupPlaylist.group_id == group_id,
-            )
-            .first()
-        )
+        async with Session() as session:
+            return await session.get(UserGroupPlaylist, (user_id, group_id))
 
-    def update_playlist_info(
+    async def update_playlist_info(
         self, user_id: int, group_id: int, new_kind: int, new_uid: int
     ):
         """Updates the kind and uid of an existing user's playlist in a group."""
-
-        playlist = (
-            session.query(UserGroupPlaylist)
-            .filter(
-                UserGroupPlaylist.user_id == user_id,
-                UserGroupPlaylist.group_id == group_id,
+        async with Session.begin() as session:
+            await session.execute(
+                update(UserGroupPlaylist)
+                .where(
+                    UserGroupPlaylist.user_id == user_id,
+                    UserGroupPlaylist.group_id == group_id,
+                )
+                .values(
+                    kind=str(new_kind),
+                    uid=new_uid,
+                    revision=None,
+                    track_count=None,
+                    music_state=None,
+                )
             )
-            .first()
-        )
-
-        playlist.kind = new_kind
-        playlist.uid = new_uid
 
-        session.commit()
+    async def update_playlist_sync_state(
+        self,
+        user_id: int,
+        group_id: int,
+        revision: int,
+        track_count: int,
+        music_state: str,
+    ):
+        """Saves the playlist revision and group state seen by the last sync."""
+        async with Session.begin() as session:
+            await session.execute(
+                update(UserGroupPlaylist)
+                .where(
+                    UserGroupPlaylist.user_id == user_id,
+                    UserGroupPlaylist.group_id == group_id,
+                )
+                .values(
+                    revision=revision,
+                    track_count=track_count,
+                    music_state=music_state,
+                )
+            )
 
     # Music functions
 
-    def insert_music(
+    async def insert_music(
         self,
         yandex_id: int,
         title: str,
@@ -337,72 +506,176 @@ class Database:
         photo_uri: str,
         user_id: Integer,
         group_id: Integer,
+        album_id: int | None = None,
+        artists: list[str] | None = None,
     ):
         """Adds a new track/album to DB."""
         new_music = Music(
             yandex_id=yandex_id,
             title=title,
             type_of_music=type_of_music,
+            album_id=album_id,
+            artists=dump_artists(artists),
             message=message,
             photo_uri=photo_uri,
             user_id=user_id,
             group_id=group_id,
         )
-        session.add(new_music)
-        session.commit()
+        async with Session.begin() as session:
+            session.add(new_music)
 
         return new_music.id
 
-    def get_music_by_id(self, music_id: int):
+    async def insert_new_group_tracks(
+        self, group_id: int, music_list: list[dict]
+    ) -> list[int]:
+        """
+        Adds the tracks the group has no history row for yet, in one transaction.
+        Each dict holds the keyword arguments of `insert_music`.
+        Returns the Yandex Music ids of the added tracks.
+        """
+        async with Session.begin() as session:
+            existing = set(
+                await session.scalars(
+                    select(Music.yandex_id).where(
+                        Music.group_id == group_id,
+                        Music.type_of_music == "track",
+                        Music.yandex_id.in_(
+                            [music["yandex_id"] for music in music_list]
+                        ),
+                    )
+                )
+            )
+            new_music = []
+            for music in music_list:
+                if music["yandex_id"] in existing:
+                    continue
+                existing.add(music["yandex_id"])
+                new_music.append(
+                    Music(
+                        **{
+                            **music,
+                            "group_id": group_id,
+                            "type_of_music": "track",
+                            "artists": dump_artists(music.get("artists")),
+                        }
+                    )
+                )
+            session.add_all(new_music)
+
+        return [music.yandex_id for music in new_music]
+
+    async def get_music_by_id(self, music_id: int):
         """Gets music by ID."""
-        return session.query(Music).filter(Music.id == music_id).first()
-
-    def update_average_rating(self, music_id: int):
-        """Recalculates average rating for music."""
-        ratings = session.query(MusicRating).filter_by(music_id=music_id).all()
-        if ratings:
-            avg = sum(r.rating for r in ratings) / len(ratings)
-            music = session.query(Music).get(music_id)
-            music.average_mark = avg
-            music.count_of_ratings = len(ratings)
-
-            session.commit()
-
-    def rate_music(self, user_id: int, music_id: int, rating: int):
-        """Adds or updates a rating for a track."""
-        existing_rating = (
-            session.query(MusicRating)
-            .filter_by(user_id=user_id, music_id=music_id)
-            .first()
-        )
+        async with Session() as session:
+            return await session.get(Music, music_id)
 
-        if existing_rating:
-            existing_rating.rating = rating
-        else:
-            new_rating = MusicRating(user_id=user_id, music_id=music_id, rating=rating)
-            session.add(new_rating)
-
-        self.update_average_rating(music_id)
-        session.commit()
+    async def get_music_without_metadata(self):
+        """
+        Returns music saved before album id and artists were stored,
+        whose metadata hasn't been looked up yet.
+        """
+        async with Session() as session:
+            result = await session.scalars(
+                select(Music).where(
+                    Music.album_id.is_(None), Music.metadata_attempted_at.is_(None)
+                )
+            )
+            return result.all()
 
-    def get_average_score_of_shared_music(self, user_id: int):
-        """Calculates average score of music shared by the user."""
-        user = session.query(User).filter(User.id == user_id).first()
-        sum_of_marks = 0
-        number_of_rated_tracks = 0
+    async def update_music_metadata(self, music_ids: list[int], updates: dict):
+        """
+        Records the metadata lookup of several music rows in one transaction,
+        setting album id and artists of the ones found.
+        `updates` maps Music.id to (album_id, list of artist names).
+        """
+        async with Session.begin() as session:
+            await session.execute(
+                update(Music)
+                .where(Music.id.in_(music_ids))
+                .values(metadata_attempted_at=int(time.time()))
+            )
+            for music_id, (album_id, artists) in updates.items():
+                await session.execute(
+                    update(Music)
+                    .where(Music.id == music_id)
+                    .values(album_id=album_id, artists=dump_artists(artists))
+                )
+
+    async def rate_music(self, user_id: int, music_id: int, rating: int):
+        """Adds or updates a rating for a track, updating the running aggregates."""
+        async with Session.begin() as session:
+            await apply_rating(session, user_id, music_id, rating)
+
+    async def rate_music_batch(self, ratings: dict[tuple[int, int], int]) -> None:
+        """
+        Adds or updates {(user_id, music_id): rating} in a single transaction.
+        Ratings of music deleted in the meantime are dropped.
+        """
+        async with Session.begin() as session:
+            existing_ids = set(
+                await session.scalars(
+                    select(Music.id).where(
+                        Music.id.in_({music_id for _, music_id in ratings})
+                    )
+                )
+            )
+            for (user_id, music_id), rating in ratings.items():
+                if music_id in existing_ids:
+                    await apply_rating(session, user_id, music_id, rating)
 
-        for music in user.shared_music:
-            sum_of_marks += music.average_mark
-            number_of_rated_tracks += 1 if music.count_of_ratings > 0 else 0
+    async def recompute_rating_aggregates(self) -> None:
+        """
+        Rebuilds the running rating aggregates of all music and users from
+        the MusicRating table (to repair drift).
+        """
+        async with engine.begin() as connection:
+            await connection.run_sync(rebuild_rating_aggregates)
+
+    # MusicMetadata functions
+
+    async def get_music_metadata(self, type_of_music: str, yandex_ids: list):
+        """Returns cached metadata rows for the given Yandex IDs."""
+        async with Session() as session:
+            result = await session.scalars(
+                select(MusicMetadata).where(
+                    MusicMetadata.type_of_music == type_of_music,
+                    MusicMetadata.yandex_id.in_(yandex_ids),
+                )
+            )
+            return result.all()
 
-        if number_of_rated_tracks > 0:
-            return sum_of_marks / number_of_rated_tracks
-        return "Пока никто не оценил"
+    async def save_music_metadata(self, records: list[dict]):
+        """Inserts or refreshes cached metadata rows."""
+        # Keyed upsert: concurrent syncs may cache the same track at the same time
+        records = {
+            (record["type_of_music"], record["yandex_id"]): record for record in records
+        }
+        statement = upsert(MusicMetadata).values(list(records.values()))
+        statement = statement.on_conflict_do_update(
+            index_elements=[MusicMetadata.type_of_music, MusicMetadata.yandex_id],
+            set_={
+                column: statement.excluded[column]
+                for column in (
+                    "title",
+                    "artists",
+                    "album_id",
+                    "cover_uri",
+                    "fetched_at",
+                )
+            },
+        )
 
-    def get_average_score_of_rated_music(self, user_id: int):
-        """Calculates average of ratings given by the user."""
-        user = session.query(User).filter(User.id == user_id).first()
+        async with Session.begin() as session:
+            await session.execute(statement)
 
-        if user.ratings:
-            return sum(r.rating for r in user.ratings) / len(user.ratings)
-        return "Пока вы не оценивали"
+    async def trim_music_metadata(self, max_rows: int):
+        """Drops the oldest cached metadata rows beyond `max_rows` in one statement."""
+        key = tuple_(MusicMetadata.type_of_music, MusicMetadata.yandex_id)
+        beyond_limit = (
+            select(MusicMetadata.type_of_music, MusicMetadata.yandex_id)
+            .order_by(MusicMetadata.fetched_at.desc())
+            .offset(max_rows)
+        )
+        async with Session.begin() as session:
+            await session.execute(delete(MusicMetadata).where(key.in_(beyond_limit)))
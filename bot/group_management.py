@@ -4,7 +4,7 @@ from telegram.ext import ContextTypes
 
 from bot.common_handlers import logger, group_selection
 from bot.constants import State, CallbackData
-from bot.music import create_or_update_playlist, delete_track_from_playlists
+from bot.music import create_or_update_playlist, delete_group_track
 from bot.sharing_music import handle_error_with_back_button
 from bot.utils import (
     database,
@@ -63,7 +63,7 @@ async def manage_groups_handler(update: Update, _) -> int:
     reply_markup = InlineKeyboardMarkup(keyboard)
 
     await query.edit_message_text(
-        f"<b>Ваши группы:</b>\n{format_groups_with_users(user.id)}",
+        f"<b>Ваши группы:</b>\n{await format_groups_with_users(user.id)}",
         reply_markup=reply_markup,
         parse_mode=telegram.constants.ParseMode.HTML,
     )
@@ -81,7 +81,7 @@ async def create_group_handler(update: Update, _) -> int:
     query = update.callback_query
     await query.answer()
 
-    if len(database.get_user_groups(user.id)) >= 5:
+    if len(await database.get_user_groups(user.id)) >= 5:
         keyboard = [
             [
                 InlineKeyboardButton(
@@ -119,7 +119,7 @@ async def receive_name_of_group_handler(update: Update, _) -> int:
 
     user_message = update.message.text
 
-    database.create_group(user_message, user.id)
+    await database.create_group(user_message, user.id)
 
     keyboard = [
         [InlineKeyboardButton("🔙 Назад", callback_data=str(CallbackData.MENU.value))],
@@ -143,7 +143,7 @@ async def delete_group_handler(update: Update, _) -> int:
     query = update.callback_query
     await query.answer()
 
-    reply_markup = group_selection(user, "delete")
+    reply_markup = await group_selection(user, "delete")
 
     await query.edit_message_text(
         "Выберите группы, которую хотите удалить", reply_markup=reply_markup
@@ -171,7 +171,7 @@ async def confirm_group_deletion_handler(update: Update, _):
     reply_markup = InlineKeyboardMarkup(keyboard)
 
     await query.edit_message_text(
-        f"❓ Вы действительно хотите удалить группу {database.get_group_name(group_id)}?",
+        f"❓ Вы действительно хотите удалить группу {await database.get_group_name(group_id)}?",
         reply_markup=reply_markup,
     )
 
@@ -188,7 +188,7 @@ async def delete_group_callback_handler(update: Update, _) -> int:
     callback_data = query.data
     group_id = int(callback_data.split("_")[1])
 
-    database.delete_group(update.effective_user.id, group_id)
+    await database.delete_group(update.effective_user.id, group_id)
 
     keyboard = [
         [InlineKeyboardButton("🔙 Назад", callback_data=str(CallbackData.MENU.value))],
@@ -231,8 +231,8 @@ async def check_name_and_choose_group_handler(
     logger.info('User %d in "check_name_and_choose_group_handler"', user.id)
 
     user_message = update.message.text
-    if database.check_username(user_message):
-        groups = database.get_user_groups(user.id)
+    if await database.check_username(user_message):
+        groups = await database.get_user_groups(user.id)
         context.user_data["add_user"] = user_message
 
         keyboard = []
@@ -293,16 +293,16 @@ async def add_user_to_the_group_handler(
     group_id = int(callback_data.split("_")[1])
     username = context.user_data["add_user"]
 
-    if len(database.get_group_users(group_id)) == 6:
+    if len(await database.get_group_users(group_id)) == 6:
         message = (
-            f"❌ В группе {database.get_group_name(group_id)} достигнут лимит "
+            f"❌ В группе {await database.get_group_name(group_id)} достигнут лимит "
             f"количества пользователей"
         )
     else:
-        database.add_user_to_group(group_id, username)
+        await database.add_user_to_group(group_id, username)
         message = (
             f"✅ Пользователь {username} успешно добавлен в группу "
-            f"{database.get_group_name(group_id)}"
+            f"{await database.get_group_name(group_id)}"
         )
 
     keyboard = [
@@ -326,7 +326,7 @@ async def create_playlist_handler(update: Update, _) -> int:
     query = update.callback_query
     await query.answer()
 
-    reply_markup = group_selection(user, "playlist")
+    reply_markup = await group_selection(user, "playlist")
 
     await query.edit_message_text(
         "<b>Как это работает</b>\n\nВ вашем аккаунте Яндекс Музыка создастся плейлист "
@@ -361,13 +361,13 @@ async def group_playlist_handler(update: Update, _) -> int:
 
     try:
         await create_or_update_playlist(
-            user.id, group_id, database.get_group_name(group_id)
+            user.id, group_id, await database.get_group_name(group_id)
         )
     except ValueError as e:
         return await handle_error_with_back_button(update, str(e))
 
     await query.edit_message_text(
-        f"✅ Плейлист {database.get_group_name(group_id)} успешно создан/обновлен",
+        f"✅ Плейлист {await database.get_group_name(group_id)} успешно создан/обновлен",
         reply_markup=reply_markup,
     )
 
@@ -382,7 +382,7 @@ async def delete_track_from_playlist_handler(update: Update, _) -> int:
 
     query = update.callback_query
 
-    reply_markup = group_selection(user, "playlist")
+    reply_markup = await group_selection(user, "playlist")
     await query.edit_message_text(
         "Выберите группу, в которой хотите удалить свой трек",
         reply_markup=reply_markup,
@@ -408,7 +408,7 @@ async def choose_track_to_delete_handler(
 
     tracks = [
         (music.title, music.id)
-        for music in database.get_group_sharing(group_id)
+        for music in await database.get_group_sharing(group_id)
         if music.user_id == user.id
     ]
 
@@ -417,7 +417,7 @@ async def choose_track_to_delete_handler(
     reply_markup, _ = build_paginated_keyboard(tracks, page=0)
 
     await query.edit_message_text(
-        f"{format_users_of_group(group_id)}Выберите трек",
+        f"{await format_users_of_group(group_id)}Выберите трек",
         reply_markup=reply_markup,
     )
     return None
@@ -433,8 +433,7 @@ async def delete_chosen_track_handler(
     await query.answer()
 
     track_id = int(query.data.split("_")[1])
-    await delete_track_from_playlists(context.user_data["delete_group_id"], track_id)
-    database.delete_track(track_id)
+    await delete_group_track(context.user_data["delete_group_id"], track_id)
 
     keyboard = [
         [InlineKeyboardButton("🔙 Назад", callback_data=str(CallbackData.MENU.value))],
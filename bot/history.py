@@ -5,17 +5,16 @@ from telegram import (
     InlineKeyboardMarkup,
     InputMediaPhoto,
 )
-from telegram.ext import ContextTypes
-
 from bot.common_handlers import logger, group_selection
-from bot.music import get_track_info, get_album_info
 from bot.utils import (
     database,
-    make_url_for_music,
+    rating_queue,
+    make_url_for_shared_music,
     fix_yandex_image_uri,
     send_or_edit_message,
 )
 from bot.constants import State, CallbackData
+from bot.settings import HISTORY_PAGE_SIZE
 
 
 async def history_handler(update: Update, _) -> int:
@@ -59,19 +58,30 @@ async def history_handler(update: Update, _) -> int:
     return State.VIEW_HISTORY.value
 
 
-def get_carousel_keyboard(current_index, total_items):
+def get_history_keyboard(
+    page: list, position: str, number: int, has_previous: bool, has_next: bool
+) -> InlineKeyboardMarkup:
     """
-    Generates a carousel keyboard with navigation buttons.
+    Generates a history page keyboard with navigation buttons.
+
+    The buttons carry the id of the music next to the page they lead to and
+    the number of that music in the history, so a page is fetched by keyset
+    and nothing is kept in the user data.
     """
 
     keyboard = []
-    if current_index > 0:
+    if has_previous:
         keyboard.append(
-            InlineKeyboardButton("⬅️", callback_data=f"prev_{current_index}")
+            InlineKeyboardButton(
+                "⬅️", callback_data=f"{position}_prev_{page[0].id}_{number - 1}"
+            )
         )
-    if current_index < total_items - 1:
+    if has_next:
         keyboard.append(
-            InlineKeyboardButton("➡️", callback_data=f"next_{current_index}")
+            InlineKeyboardButton(
+                "➡️",
+                callback_data=f"{position}_next_{page[-1].id}_{number + len(page)}",
+            )
         )
     return InlineKeyboardMarkup(
         [
@@ -90,13 +100,7 @@ async def simple_format_history_music(music, is_group: bool, index: int) -> str:
     Formats a single music entry into a clickable link with user or group information.
     """
 
-    music_info = (
-        await get_track_info(music.user_id, music.yandex_id)
-        if music.type_of_music == "track"
-        else await get_album_info(music.user_id, music.yandex_id)
-    )
-
-    music_url = make_url_for_music(music_info, music.type_of_music)
+    music_url = make_url_for_shared_music(music)
     mark = f"{music.average_mark:.2f}" if music.count_of_ratings > 0 else "-"
 
     text = (
@@ -104,9 +108,9 @@ async def simple_format_history_music(music, is_group: bool, index: int) -> str:
         f"Ср. оценка: {mark} "
     )
     if is_group:
-        text += f"| Пользователь: {database.get_username(music.user_id)}"
+        text += f"| Пользователь: {await database.get_username(music.user_id)}"
     else:
-        text += f"| Группа: {database.get_group_name(music.group_id)}"
+        text += f"| Группа: {await database.get_group_name(music.group_id)}"
 
     return text
 
@@ -116,15 +120,12 @@ async def format_music_entry(music, is_group: bool, index: int = -1) -> str:
     Formats a single music entry into a clickable link with user or group information.
     """
 
-    music_info = (
-        await get_track_info(music.user_id, music.yandex_id)
-        if music.type_of_music == "track"
-        else await get_album_info(music.user_id, music.yandex_id)
-    )
-    music_url = make_url_for_music(music_info, music.type_of_music)
+    music_url = make_url_for_shared_music(music)
 
     mark = f"{music.average_mark:.2f}" if music.count_of_ratings > 0 else "Оценок нет"
 
+    username = await database.get_username(music.user_id)
+
     if index != -1:
         text = (
             f'{index}. <a href="{music_url}">{music.title}</a>\n\n<b>Ср. '
@@ -133,53 +134,28 @@ async def format_music_entry(music, is_group: bool, index: int = -1) -> str:
     else:
         text = (
             f'<a href="{music_url}">{music.title}</a>\n\n<b>Ср. оценка: '
-            f"{mark}</b>\n\n Пользователь: {database.get_username(music.user_id)}\n"
+            f"{mark}</b>\n\n Пользователь: {username}\n"
         )
 
     if is_group:
-        text += (
-            f"Пользователь: {database.get_username(music.user_id)}\n<blockquote>"
-            f"{music.message}</blockquote>"
-        )
+        text += f"Пользователь: {username}\n<blockquote>{music.message}</blockquote>"
     else:
-        group_name = database.get_group_name(music.group_id)
+        group_name = await database.get_group_name(music.group_id)
         if group_name is None:
-            text += f"Группа: Без группы\n<blockquote>{music.message}</blockquote>"
-        else:
-            text += (
-                f"Группа: {database.get_group_name(music.group_id)}\n<blockquote>"
-                f"{music.message}</blockquote>"
-            )
+            group_name = "Без группы"
+        text += f"Группа: {group_name}\n<blockquote>{music.message}</blockquote>"
 
     return text
 
 
-async def get_history_data(update: Update, is_group: bool) -> tuple[list, str]:
+async def display_carousel(query, music, is_group: bool, number: int, reply_markup):
     """
-    Fetches the history data and prepares the initial text.
+    Displays a single history entry as a carousel item.
     """
 
-    if is_group:
-        callback_data = update.callback_query.data
-        group_id = int(callback_data.split("_")[1])
-        history = database.get_group_sharing(group_id)
-        text = f"<b>История группы {database.get_group_name(group_id)}</b>\n\n"
-    else:
-        history = database.get_user_sharing(update.effective_user.id)
-        text = "<b>Моя история:</b>\n\n"
-
-    return history, text
-
+    await database.load_display_names({music.user_id}, {music.group_id})
 
-async def display_carousel(query, history: list, is_group: bool):
-    """
-    Displays the history as a carousel.
-    """
-
-    current_index = 0
-    music = history[current_index]
-    text = await format_music_entry(music, is_group=is_group, index=current_index + 1)
-    reply_markup = get_carousel_keyboard(current_index, len(history))
+    text = await format_music_entry(music, is_group=is_group, index=number)
 
     await query.edit_message_media(
         media=InputMediaPhoto(
@@ -191,27 +167,27 @@ async def display_carousel(query, history: list, is_group: bool):
     )
 
 
-async def display_list(query, history: list, text: str, is_group: bool):
+async def display_list(query, page: list, is_group: bool, number: int, reply_markup):
     """
-    Displays the history as a list.
+    Displays a page of the history as a list.
     """
 
-    text += "\n".join(
-        [
-            await simple_format_history_music(
-                music, is_group=is_group, index=(index + 1)
-            )
-            for index, music in enumerate(history)
-        ]
+    await database.load_display_names(
+        {music.user_id for music in page}, {music.group_id for music in page}
     )
-    keyboard = [
-        [
-            InlineKeyboardButton(
-                "🔙 Назад", callback_data=str(CallbackData.HISTORY.value)
-            )
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+
+    if is_group:
+        group_name = await database.get_group_name(page[0].group_id)
+        text = f"<b>История группы {group_name}</b>\n\n"
+    else:
+        text = "<b>Моя история:</b>\n\n"
+
+    lines = []
+    for index, music in enumerate(page, start=number):
+        lines.append(
+            await simple_format_history_music(music, is_group=is_group, index=index)
+        )
+    text += "\n".join(lines)
 
     await query.edit_message_text(
         text,
@@ -221,21 +197,29 @@ async def display_list(query, history: list, text: str, is_group: bool):
     )
 
 
-async def get_history(
-    update: Update,
-    context: ContextTypes.DEFAULT_TYPE,
-    is_carousel: bool,
-    is_group: bool,
+async def display_history_page(
+    query,
+    position: str,
+    after_id: int | None = None,
+    before_id: int | None = None,
+    number: int = 1,
 ):
     """
-    Displays the sharing history either as a carousel or a list.
+    Fetches and displays a page of the sharing history.
+
+    `position` is "history_{list|carousel}_{u|g}{owner id}"; `number` is the
+    number of the music next to `after_id` or `before_id` in the history.
     """
 
-    query = update.callback_query
-    await query.answer()
+    _, mode, owner = position.split("_")
+    is_group = owner[0] == "g"
+    owner_id = {"group_id" if is_group else "user_id": int(owner[1:])}
+    limit = 1 if mode == "carousel" else HISTORY_PAGE_SIZE
 
-    history, text = await get_history_data(update, is_group)
-    if not history:
+    page, has_previous, has_next = await database.get_sharing_page(
+        **owner_id, after_id=after_id, before_id=before_id, limit=limit
+    )
+    if not page:
         keyboard = [
             [
                 InlineKeyboardButton(
@@ -245,52 +229,56 @@ async def get_history(
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text("Ваша история пуста", reply_markup=reply_markup)
-        return State.VIEW_HISTORY.value
+        return
+
+    if before_id is not None:
+        number -= len(page) - 1
+    reply_markup = get_history_keyboard(page, position, number, has_previous, has_next)
 
-    if is_carousel:
-        await display_carousel(query, history, is_group)
-        context.user_data["is_group"] = is_group
-        context.user_data["group_sharing_history"] = history
+    if mode == "carousel":
+        await display_carousel(query, page[0], is_group, number, reply_markup)
     else:
-        await display_list(query, history, text, is_group)
+        await display_list(query, page, is_group, number, reply_markup)
 
 
-async def carousel_navigation_handler(
-    update: Update, context: ContextTypes.DEFAULT_TYPE
-):
+async def get_history(update: Update, is_carousel: bool, is_group: bool):
     """
-    Handles navigation through the carousel.
+    Displays the first page of the sharing history either as a carousel or a list.
     """
 
-    logger.info('User %d in "carousel_navigation_handler"', update.effective_user.id)
     query = update.callback_query
     await query.answer()
 
-    callback_data = query.data
-    direction, current_index = callback_data.split("_")
-    current_index = int(current_index)
+    if is_group:
+        owner = f"g{int(query.data.split('_')[1])}"
+    else:
+        owner = f"u{update.effective_user.id}"
+    mode = "carousel" if is_carousel else "list"
 
-    history = context.user_data["group_sharing_history"]
+    await rating_queue.flush_user(update.effective_user.id)
+    await display_history_page(query, f"history_{mode}_{owner}")
 
-    if direction == "prev":
-        current_index -= 1
-    elif direction == "next":
-        current_index += 1
 
-    music = history[current_index]
-    text = await format_music_entry(
-        music, is_group=context.user_data["is_group"], index=current_index + 1
-    )
-    reply_markup = get_carousel_keyboard(current_index, len(history))
+async def history_navigation_handler(update: Update, _):
+    """
+    Handles navigation through the history pages and the carousel.
+    """
 
-    await query.edit_message_media(
-        media=InputMediaPhoto(
-            media=fix_yandex_image_uri(music.photo_uri),
-            caption=text,
-            parse_mode=telegram.constants.ParseMode.HTML,
-        ),
-        reply_markup=reply_markup,
-    )
+    logger.info('User %d in "history_navigation_handler"', update.effective_user.id)
+    query = update.callback_query
+    await query.answer()
+
+    _, mode, owner, direction, music_id, number = query.data.split("_")
+    position = f"history_{mode}_{owner}"
+    await rating_queue.flush_user(update.effective_user.id)
+    if direction == "prev":
+        await display_history_page(
+            query, position, before_id=int(music_id), number=int(number)
+        )
+    else:
+        await display_history_page(
+            query, position, after_id=int(music_id), number=int(number)
+        )
 
 
 async def select_group_history(update: Update, cl_data):
@@ -302,7 +290,7 @@ async def select_group_history(update: Update, cl_data):
     query = update.callback_query
     await query.answer()
 
-    reply_markup = group_selection(user, cl_data)
+    reply_markup = await group_selection(user, cl_data)
     await query.edit_message_text(
         "Выберите группу, историю которой хотите посмотреть",
         reply_markup=reply_markup,
@@ -327,9 +315,7 @@ async def group_history_carousel_handler(update: Update, _):
     await select_group_history(update, "carouselHistory")
 
 
-async def display_my_history_list_handler(
-    update: Update, context: ContextTypes.DEFAULT_TYPE
-):
+async def display_my_history_list_handler(update: Update, _):
     """
     Displays the user's personal sharing history as a list.
     """
@@ -337,12 +323,10 @@ async def display_my_history_list_handler(
     logger.info(
         'User %d in "display_my_history_list_handler"', update.effective_user.id
     )
-    await get_history(update, context, is_group=False, is_carousel=False)
+    await get_history(update, is_group=False, is_carousel=False)
 
 
-async def display_my_history_carousel_handler(
-    update: Update, context: ContextTypes.DEFAULT_TYPE
-):
+async def display_my_history_carousel_handler(update: Update, _):
     """
     Displays the user's personal sharing history as a carousel.
     """
@@ -350,12 +334,10 @@ async def display_my_history_carousel_handler(
     logger.info(
         'User %d in "display_my_history_carousel_handler"', update.effective_user.id
     )
-    await get_history(update, context, is_group=False, is_carousel=True)
+    await get_history(update, is_group=False, is_carousel=True)
 
 
-async def display_group_history_list_handler(
-    update: Update, context: ContextTypes.DEFAULT_TYPE
-):
+async def display_group_history_list_handler(update: Update, _):
     """
     Displays the group's sharing history as a list.
     """
@@ -363,12 +345,10 @@ async def display_group_history_list_handler(
     logger.info(
         'User %d in "display_group_history_list_handler"', update.effective_user.id
     )
-    await get_history(update, context, is_group=True, is_carousel=False)
+    await get_history(update, is_group=True, is_carousel=False)
 
 
-async def display_group_history_carousel_handler(
-    update: Update, context: ContextTypes.DEFAULT_TYPE
-):
+async def display_group_history_carousel_handler(update: Update, _):
     """
     Displays the group's sharing history as a carousel.
     """
@@ -376,4 +356,4 @@ async def display_group_history_carousel_handler(
     logger.info(
         'User %d in "display_group_history_carousel_handler"', update.effective_user.id
     )
-    await get_history(update, context, is_group=True, is_carousel=True)
+    await get_history(update, is_group=True, is_carousel=True)
@@ -5,23 +5,50 @@ from telegram import Update
 from telegram.ext import Application
 
 from bot.conversation import register_handlers
-from bot.music import playlist_update_job
+from bot.music import playlist_update_job, backfill_music_metadata_job
+from bot.settings import SYNC_INTERVAL
+from bot.utils import database, rating_queue
 
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
 )
 
 
+async def post_init(_: Application) -> None:
+    """
+    Brings the DB schema up to date before the bot starts handling updates.
+    """
+
+    await database.migrate()
+
+
+async def post_shutdown(_: Application) -> None:
+    """
+    Writes the queued rating votes and closes the DB connections once the bot
+    has stopped.
+    """
+
+    await rating_queue.close()
+    await database.close()
+
+
 def main():
     """
     Initializes the bot, sets up the application, and starts polling for updates.
     """
 
-    application = Application.builder().token(config("TOKEN")).build()
+    application = (
+        Application.builder()
+        .token(config("TOKEN"))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     register_handlers(application)
 
     job_queue = application.job_queue
-    job_queue.run_repeating(playlist_update_job, interval=100, first=10)
+    job_queue.run_once(backfill_music_metadata_job, when=0)
+    job_queue.run_repeating(playlist_update_job, interval=SYNC_INTERVAL, first=10)
 
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
@@ -0,0 +1,156 @@
+import json
+import time
+from collections import OrderedDict
+
+from bot.settings import (
+    METADATA_CACHE_SIZE,
+    METADATA_CACHE_DB_SIZE,
+    METADATA_CACHE_TTL,
+)
+
+
+class MusicInfo:
+    """
+    Compact metadata of a Yandex Music track or album.
+    """
+
+    __slots__ = ("type_of_music", "id", "title", "artists", "album_id", "cover_uri")
+
+    def __init__(
+        self,
+        *,
+        type_of_music: str,
+        yandex_id: int,
+        title: str,
+        artists: list[str],
+        album_id: int | None,
+        cover_uri: str | None,
+    ):
+        self.type_of_music = type_of_music
+        self.id = yandex_id
+        self.title = title
+        self.artists = artists
+        self.album_id = album_id
+        self.cover_uri = cover_uri
+
+    @property
+    def full_title(self) -> str:
+        """Artists and title, e.g. "Artist1, Artist2 — Title"."""
+        return f"{', '.join(self.artists)} — {self.title}"
+
+    @classmethod
+    def from_yandex(cls, type_of_music: str, music):
+        """Builds the record from a `yandex_music` Track or Album object."""
+
+        if type_of_music == "track":
+            album_id = music.albums[0].id if music.albums else None
+        else:
+            album_id = music.id
+
+        return cls(
+            type_of_music=type_of_music,
+            yandex_id=int(music.id),
+            title=music.title,
+            artists=[artist.name for artist in music.artists],
+            album_id=album_id,
+            cover_uri=music.cover_uri,
+        )
+
+
+class MetadataCache:
+    """
+    Two-tier cache of track/album metadata keyed by (type, yandex_id):
+    an in-process LRU in front of the MusicMetadata table.
+    Metadata is effectively immutable, so entries only expire by TTL.
+    """
+
+    def __init__(
+        self,
+        database,
+        max_size: int = METADATA_CACHE_SIZE,
+        max_db_rows: int = METADATA_CACHE_DB_SIZE,
+        ttl: float = METADATA_CACHE_TTL,
+    ):
+        self.database = database
+        self.max_size = max_size
+        self.max_db_rows = max_db_rows
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (type, yandex_id) -> (MusicInfo, fetched_at)
+        self._rows_since_trim = 0
+
+    def _remember(self, info: MusicInfo, fetched_at: float) -> None:
+        key = (info.type_of_music, info.id)
+        self._entries[key] = (info, fetched_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get_many(self, type_of_music: str, yandex_ids: list) -> dict:
+        """
+        Returns {yandex_id: MusicInfo} for the ids found in memory or in the DB.
+        Missing and expired ids are left out.
+        """
+
+        now = time.time()
+        found = {}
+        missing_ids = []
+
+        for yandex_id in map(int, yandex_ids):
+            entry = self._entries.get((type_of_music, yandex_id))
+            if entry and now - entry[1] <= self.ttl:
+                self._entries.move_to_end((type_of_music, yandex_id))
+                found[yandex_id] = entry[0]
+            else:
+                missing_ids.append(yandex_id)
+
+        if missing_ids:
+            for row in await self.database.get_music_metadata(
+                type_of_music, missing_ids
+            ):
+                if now - row.fetched_at > self.ttl:
+                    continue
+
+                info = MusicInfo(
+                    type_of_music=row.type_of_music,
+                    yandex_id=row.yandex_id,
+                    title=row.title,
+                    artists=json.loads(row.artists),
+                    album_id=row.album_id,
+                    cover_uri=row.cover_uri,
+                )
+                self._remember(info, row.fetched_at)
+                found[info.id] = info
+
+        return found
+
+    async def put_many(self, infos: list[MusicInfo]) -> None:
+        """Stores freshly fetched metadata in both tiers."""
+
+        if not infos:
+            return
+
+        now = time.time()
+        for info in infos:
+            self._remember(info, now)
+
+        await self.database.save_music_metadata(
+            [
+                {
+                    "type_of_music": info.type_of_music,
+                    "yandex_id": info.id,
+                    "title": info.title,
+                    "artists": json.dumps(info.artists, ensure_ascii=False),
+                    "album_id": info.album_id,
+                    "cover_uri": info.cover_uri,
+                    "fetched_at": now,
+                }
+                for info in infos
+            ]
+        )
+
+        # The table may outgrow max_db_rows by a tenth between trims, which keeps
+        # the trim off the path of every write
+        self._rows_since_trim += len(infos)
+        if self._rows_since_trim >= max(self.max_db_rows // 10, 1):
+            self._rows_since_trim = 0
+            await self.database.trim_music_metadata(self.max_db_rows)
@@ -0,0 +1,132 @@
+import logging
+import time
+
+from sqlalchemy import func, insert, inspect, select, text
+
+from bot.models import Base, engine, schema_version
+from bot.ratings import rebuild_rating_aggregates
+
+logger = logging.getLogger(__name__)
+
+
+def migrations() -> list:
+    """
+    Returns the schema migrations as (version, description, function).
+    A function gets a sync connection and runs in the transaction that
+    records its version. To change the schema of existing databases,
+    append a migration with the next version; never edit applied ones.
+    A new database gets its tables from the current models and skips
+    them all, while an unversioned one runs them all after version 1 has
+    created its missing tables from the current models, so migrations
+    must check the schema before changing it (see `add_missing_columns`).
+    """
+    return [
+        (1, "Create missing tables", Base.metadata.create_all),
+        (2, "Add columns introduced after release", add_late_columns),
+        (3, "Create indexes of the hot lookups", add_missing_indexes),
+        (4, "Record metadata backfill attempts", add_missing_columns),
+    ]
+
+
+async def apply_migrations(database) -> list[int]:
+    """
+    Applies the migrations newer than the version recorded in the
+    `schema_version` table, each in its own transaction, holding the
+    database lock so that processes starting together apply them once.
+    A new database is created from the models at the latest version.
+    Returns the applied versions.
+    """
+    all_migrations = migrations()
+    async with database.lock("schema_version"):
+        async with engine.begin() as connection:
+            await connection.run_sync(schema_version.create, checkfirst=True)
+            current = await connection.scalar(
+                select(func.coalesce(func.max(schema_version.c.version), 0))
+            )
+            if current == 0 and not await connection.run_sync(_has_tables):
+                latest, _, _ = all_migrations[-1]
+                await connection.run_sync(Base.metadata.create_all)
+                await connection.execute(
+                    insert(schema_version).values(
+                        version=latest,
+                        description="Create tables of a new database",
+                        applied_at=int(time.time()),
+                    )
+                )
+                logger.info("Created a new database at schema version %d", latest)
+                return [latest]
+
+        applied = []
+        for version, description, migration in all_migrations:
+            if version <= current:
+                continue
+            async with engine.begin() as connection:
+                await connection.run_sync(migration)
+                await connection.execute(
+                    insert(schema_version).values(
+                        version=version,
+                        description=description,
+                        applied_at=int(time.time()),
+                    )
+                )
+            logger.info("Applied schema migration %d: %s", version, description)
+            applied.append(version)
+        return applied
+
+
+def _has_tables(connection) -> bool:
+    """Checks whether any table of the models already exists."""
+    inspector = inspect(connection)
+    return any(
+        inspector.has_table(table.name)
+        for table in Base.metadata.sorted_tables
+        if table is not schema_version
+    )
+
+
+def add_missing_indexes(connection) -> None:
+    """
+    Creates indexes that were introduced after a table had been created,
+    since `create_all` only creates indexes together with their tables.
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def add_late_columns(connection) -> None:
+    """
+    Adds the columns that appeared in existing tables before migrations were
+    versioned, filling in the running rating aggregates if they are new.
+    """
+    if "Users.sum_of_ratings" in add_missing_columns(connection):
+        rebuild_rating_aggregates(connection)
+
+
+def add_missing_columns(connection) -> list[str]:
+    """
+    Adds columns that were introduced after a table had been created,
+    since `create_all` only creates missing tables.
+    Returns the added columns as "table.column".
+    """
+    added_columns = []
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+
+            column_type = column.type.compile(connection.dialect)
+            connection.execute(
+                text(
+                    f'ALTER TABLE "{table.name}" '
+                    f'ADD COLUMN "{column.name}" {column_type}'
+                )
+            )
+            added_columns.append(f"{table.name}.{column.name}")
+
+    return added_columns
@@ -0,0 +1,260 @@
+from sqlalchemy import (
+    event,
+    Column,
+    Integer,
+    BigInteger,
+    String,
+    ForeignKey,
+    Table,
+    Float,
+    Index,
+    UniqueConstraint,
+)
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.pool import NullPool
+
+from bot.settings import (
+    DATABASE_URL,
+    DATABASE_POOL_SIZE,
+    DATABASE_MAX_OVERFLOW,
+    SQLITE_JOURNAL_MODE,
+    SQLITE_SYNCHRONOUS,
+    SQLITE_CACHE_SIZE,
+    SQLITE_MMAP_SIZE,
+    SQLITE_TEMP_STORE,
+    SQLITE_BUSY_TIMEOUT,
+)
+
+SQLITE_PRAGMAS = {
+    "journal_mode": SQLITE_JOURNAL_MODE,  # WAL: readers don't block the writer
+    "synchronous": SQLITE_SYNCHRONOUS,  # NORMAL: no fsync per commit in WAL mode
+    "cache_size": SQLITE_CACHE_SIZE,
+    "mmap_size": SQLITE_MMAP_SIZE,
+    "temp_store": SQLITE_TEMP_STORE,
+    "busy_timeout": SQLITE_BUSY_TIMEOUT,  # wait for a lock instead of failing
+}
+
+
+def apply_sqlite_pragmas(
+    dbapi_connection, _connection_record=None, pragmas: dict = None
+) -> None:
+    """Applies the SQLite profile to a freshly opened connection ("connect" event)."""
+    cursor = dbapi_connection.cursor()
+    for name, value in (SQLITE_PRAGMAS if pragmas is None else pragmas).items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+
+if DATABASE_URL.startswith("sqlite"):
+    engine = create_async_engine(DATABASE_URL)
+    event.listen(engine.sync_engine, "connect", apply_sqlite_pragmas)
+else:
+    engine = create_async_engine(
+        DATABASE_URL,
+        pool_size=DATABASE_POOL_SIZE,
+        max_overflow=DATABASE_MAX_OVERFLOW,
+        pool_pre_ping=True,
+    )
+# Advisory locks get connections of their own, outside the pool: a lock holder
+# waiting for a pooled connection could otherwise starve the others. A single
+# process uses SQLite, see Database.lock
+lock_engine = (
+    create_async_engine(DATABASE_URL, poolclass=NullPool)
+    if engine.dialect.name == "postgresql"
+    else None
+)
+# Upserts are dialect-specific, both dialects share the ON CONFLICT API
+upsert = postgresql_insert if engine.dialect.name == "postgresql" else sqlite_insert
+# One short-lived session per unit of work; loaded objects stay usable after commit
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+Base = declarative_base()
+
+# Telegram user ids exceed 32 bits; SQLite integers are 64-bit already
+TelegramId = BigInteger().with_variant(Integer, "sqlite")
+
+# Table for connecting users and groups (many-to-many relationship)
+user_group_association = Table(
+    "user_group_association",
+    Base.metadata,
+    Column("user_id", TelegramId, ForeignKey("Users.id"), primary_key=True),
+    Column("group_id", Integer, ForeignKey("Group.id"), primary_key=True),
+    # The primary key covers lookups by user, this one lookups by group
+    Index("ix_user_group_association_group_id", "group_id"),
+)
+
+# Applied schema migrations, see bot.migrations
+schema_version = Table(
+    "schema_version",
+    Base.metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", Integer, nullable=False),  # Unix time
+)
+
+
+class User(Base):
+    """
+    Represents a user.
+
+    Relationships:
+        ratings: List of ratings the user gave.
+        groups: Groups the user belongs to.
+        shared_music: Music shared by the user.
+        group_playlists: Playlist info per group.
+    """
+
+    __tablename__ = "Users"
+
+    id = Column(TelegramId, primary_key=True)  # Telegram user.id
+    name = Column(String, nullable=False, index=True)  # Telegram username
+    token = Column(String, nullable=True)  # Yandex Music token
+    count_of_sharing = Column(Integer, default=0)
+    # Running aggregates, kept up to date by rate_music and delete_track
+    count_of_ratings = Column(Integer, default=0)  # Ratings the user gave
+    sum_of_ratings = Column(Integer, default=0)
+    count_of_rated_shared = Column(Integer, default=0)  # Shared music with ratings
+    sum_of_shared_marks = Column(Float, default=0)  # Sum of their average marks
+
+    ratings = relationship("MusicRating", back_populates="user")
+    groups = relationship(
+        "Group", secondary=user_group_association, back_populates="users"
+    )
+    shared_music = relationship("Music", back_populates="shared_by")
+    group_playlists = relationship("UserGroupPlaylist", back_populates="user")
+
+
+class Group(Base):
+    """
+    Represents a group of users.
+
+    Relationships:
+        users: Members of the group.
+        music: Shared music in the group.
+        user_playlists: Playlist info per user in this group.
+    """
+
+    __tablename__ = "Group"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    creator_id = Column(TelegramId, ForeignKey("Users.id"), nullable=False)
+
+    users = relationship(
+        "User",
+        secondary=user_group_association,
+        back_populates="groups",
+        order_by="User.id",
+    )
+    music = relationship("Music", back_populates="group")
+    user_playlists = relationship("UserGroupPlaylist", back_populates="group")
+
+
+class UserGroupPlaylist(Base):
+    """
+    Stores Yandex Music playlist info for each user in a group.
+    First of all, it is necessary to save playlist_kind for each user in each group.
+
+    Relationships:
+        user: Related User object.
+        group: Related Group object.
+    """
+
+    __tablename__ = "UserGroupPlaylist"
+
+    user_id = Column(TelegramId, ForeignKey("Users.id"), primary_key=True)
+    group_id = Column(Integer, ForeignKey("Group.id"), primary_key=True, index=True)
+    uid = Column(BigInteger, nullable=False)
+    kind = Column(String, nullable=False)
+    # State seen by the last sync, used to skip unchanged playlists
+    revision = Column(Integer, nullable=True)  # Yandex Music playlist revision
+    track_count = Column(Integer, nullable=True)
+    music_state = Column(String, nullable=True)  # See Database.get_group_music_state
+
+    user = relationship("User", back_populates="group_playlists")
+    group = relationship("Group", back_populates="user_playlists")
+
+
+class Music(Base):
+    """
+    Represents a track or album shared by a user.
+
+    Relationships:
+        shared_by: User who shared the music.
+        group: Group where it was shared.
+        ratings: Ratings given to this music.
+    """
+
+    __tablename__ = "Music"
+
+    id = Column(Integer, primary_key=True)
+    yandex_id = Column(Integer, nullable=False)  # Yandex Music track id
+    title = Column(String, nullable=False)  # Artist and title of music
+    type_of_music = Column(String, nullable=False)  # Track or album
+    album_id = Column(Integer, nullable=True)  # Yandex Music album id
+    artists = Column(String, nullable=True)  # JSON list of artist names
+    # Unix time of the backfill lookup of album id and artists, see bot.music
+    metadata_attempted_at = Column(Integer, nullable=True)
+    message = Column(String, nullable=False)  # Text from user
+    photo_uri = Column(String, nullable=False)
+    average_mark = Column(Float, default=0)
+    count_of_ratings = Column(Integer, default=0)
+    sum_of_ratings = Column(Integer, default=0)
+
+    ratings = relationship("MusicRating", back_populates="music")
+
+    user_id = Column(TelegramId, ForeignKey("Users.id"), index=True)
+    shared_by = relationship("User", back_populates="shared_music")
+
+    group_id = Column(Integer, ForeignKey("Group.id"))
+    group = relationship("Group", back_populates="music")
+
+    __table_args__ = (
+        # Group history and the group's track lookups; also serves group_id alone
+        Index("ix_music_group_type_yandex", "group_id", "type_of_music", "yandex_id"),
+    )
+
+
+class MusicRating(Base):
+    """
+    Represents a rating given by a user to a specific piece of music.
+    There is a unique constraint on (user_id, music_id) — one rating per user per music.
+
+    Relationships:
+        user: Who rated.
+        music: What was rated.
+    """
+
+    __tablename__ = "MusicRating"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(TelegramId, ForeignKey("Users.id"), nullable=False)
+    music_id = Column(Integer, ForeignKey("Music.id"), nullable=False, index=True)
+    rating = Column(Integer, nullable=False)
+
+    user = relationship("User")
+    music = relationship("Music")
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "music_id", name="unique_user_music_rating"),
+    )
+
+
+class MusicMetadata(Base):
+    """
+    Cached compact metadata of a Yandex Music track or album.
+    Artists are stored as a JSON list of names.
+    """
+
+    __tablename__ = "MusicMetadata"
+
+    type_of_music = Column(String, primary_key=True)  # Track or album
+    yandex_id = Column(Integer, primary_key=True)
+    title = Column(String, nullable=False)
+    artists = Column(String, nullable=False)
+    album_id = Column(Integer, nullable=True)
+    cover_uri = Column(String, nullable=True)
+    fetched_at = Column(Float, nullable=False, index=True)  # Unix time
@@ -1,240 +1,784 @@
+import asyncio
+import time
+import unicodedata
+from collections import Counter
+from collections.abc import Sequence
+
 import yandex_music.exceptions
 from yandex_music import ClientAsync
+from yandex_music.utils.difference import Difference
 
+from bot.cache import TTLCache
+from bot.client_pool import client_pool, circuit_breaker
 from bot.common_handlers import logger
+from bot.metadata_cache import MetadataCache, MusicInfo
+from bot.request_governor import governor
+from bot.settings import (
+    METADATA_CACHE_SIZE,
+    METADATA_CACHE_TTL,
+    SEARCH_CACHE_SIZE,
+    SEARCH_CACHE_TTL,
+    SYNC_CONCURRENCY,
+    SYNC_TASK_TIMEOUT,
+)
 from bot.utils import database
 
+# Max number of ids resolved by a single `tracks`/`albums` request
+METADATA_CHUNK_SIZE = 100
+# Max number of tracks inserted by a single playlist `change` request
+PLAYLIST_CHANGE_CHUNK_SIZE = 100
+# How many times a playlist diff is recomputed after a revision conflict
+PLAYLIST_CHANGE_ATTEMPTS = 3
+# Max number of members' playlists a track is deleted from at the same time
+PLAYLIST_DELETE_CONCURRENCY = 6
+# Max number of search results offered to the user
+SEARCH_RESULTS_LIMIT = 6
+
+metadata_cache = MetadataCache(database)
+search_cache = TTLCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+# Tracks that can't be added to playlists (no album, or gone from Yandex Music),
+# left out of the sync until they expire like any other cached metadata
+unsyncable_tracks = TTLCache(METADATA_CACHE_SIZE, METADATA_CACHE_TTL)
+
+INVALID_TOKEN_MESSAGE = (
+    "❌ Ваш токен Яндекс Музыки неверен.\n\nПожалуйста, обновите его, "
+    "используя /token"
+)
+
 
 async def get_yandex_music_client(user_id: int):
     """
-    Retrieves and validates the Yandex Music token, then initializes the client.
+    Retrieves and validates the Yandex Music token, then returns an initialized client
+    from the pool (the client is initialized only on the first call or after expiry).
     """
 
-    token = database.get_token(user_id)
+    token = await database.get_token(user_id)
     if not token:
         raise ValueError(
             "❌ У вас нет токена для доступа в Яндекс Музыку.\n\nПожалуйста, обновите его, "
             "используя /token"
         )
 
+    # The token has failed repeatedly, don't waste a round trip until the backoff passes
+    if circuit_breaker.is_open(user_id):
+        raise ValueError(INVALID_TOKEN_MESSAGE)
+
     try:
-        client = await ClientAsync(token).init()
-        return client
+        client = await client_pool.get(user_id, token)
+    except yandex_music.exceptions.UnauthorizedError as e:
+        circuit_breaker.record_failure(user_id)
+        raise ValueError(INVALID_TOKEN_MESSAGE) from e
     except yandex_music.exceptions.YandexMusicError as e:
-        raise ValueError(
-            "❌ Ваш токен Яндекс Музыки неверен.\n\nПожалуйста, обновите его, используя /token"
-        ) from e
+        raise ValueError(INVALID_TOKEN_MESSAGE) from e
+
+    circuit_breaker.record_success(user_id)
+    return client
+
+
+def report_auth_failure(user_id: int, error: Exception) -> None:
+    """
+    Counts a rejected token of an already initialized client: the client is dropped
+    from the pool and the failure goes to the user's circuit breaker.
+    """
+
+    if isinstance(error, yandex_music.exceptions.UnauthorizedError):
+        client_pool.invalidate(user_id)
+        circuit_breaker.record_failure(user_id)
+
 
+def token_rejected(user_id: int, error: Exception) -> ValueError:
+    """
+    Reports a token rejected during a user request (it may have been revoked while
+    its client was pooled) and returns the "invalid token" error shown to the user.
+    """
+
+    report_auth_failure(user_id, error)
+    return ValueError(INVALID_TOKEN_MESSAGE)
 
-async def get_last_n_liked_track(user_id: int, n: int):
+
+async def get_last_n_liked_track(user_id: int, n: int) -> list[MusicInfo]:
     """
     Returns the last n liked tracks for a user.
     """
 
     client = await get_yandex_music_client(user_id)
 
-    five_liked_short_track = (await client.users_likes_tracks())[:n]
-    result = []
-    for i in range(0, n):
-        result.append((await client.tracks(five_liked_short_track[i].id))[0])
+    try:
+        liked_short_tracks = (await client.users_likes_tracks())[:n]
+    except yandex_music.exceptions.UnauthorizedError as e:
+        raise token_rejected(user_id, e) from e
 
-    return result
+    return await fetch_music(
+        user_id, "track", [track.id for track in liked_short_tracks], client
+    )
 
 
-async def get_track_info(user_id: int, track_id: int):
+async def fetch_music(
+    user_id: int,
+    type_of_music: str,
+    yandex_ids: list,
+    client: ClientAsync = None,
+) -> list[MusicInfo]:
     """
-    Returns info about a specific track by its Yandex ID.
+    Returns info about several tracks or albums in the order of `yandex_ids`.
+    The metadata cache is consulted first; only the missing ids are requested from
+    Yandex Music, in chunks of METADATA_CHUNK_SIZE ids.
     """
 
-    client = await get_yandex_music_client(user_id)
+    found = await metadata_cache.get_many(type_of_music, yandex_ids)
+    missing_ids = [yandex_id for yandex_id in yandex_ids if int(yandex_id) not in found]
 
-    return (await client.tracks(track_id))[0]
+    if missing_ids:
+        if client is None:
+            client = await get_yandex_music_client(user_id)
+        request = client.tracks if type_of_music == "track" else client.albums
 
+        fetched = []
+        for start in range(0, len(missing_ids), METADATA_CHUNK_SIZE):
+            chunk = missing_ids[start : start + METADATA_CHUNK_SIZE]
+            try:
+                fetched.extend(
+                    MusicInfo.from_yandex(type_of_music, music)
+                    for music in await request(chunk)
+                )
+            except yandex_music.exceptions.UnauthorizedError as e:
+                raise token_rejected(user_id, e) from e
 
-async def get_album_info(user_id: int, track_id: int):
+        await metadata_cache.put_many(fetched)
+        found.update({info.id: info for info in fetched})
+
+    return [
+        found[int(yandex_id)] for yandex_id in yandex_ids if int(yandex_id) in found
+    ]
+
+
+async def get_track_info(user_id: int, track_id: int) -> MusicInfo:
+    """
+    Returns info about a specific track by its Yandex ID.
+    """
+
+    return (await fetch_music(user_id, "track", [track_id]))[0]
+
+
+async def get_album_info(user_id: int, album_id: int) -> MusicInfo:
     """
     Returns info about a specific album by its Yandex ID.
     """
 
-    client = await get_yandex_music_client(user_id)
+    return (await fetch_music(user_id, "album", [album_id]))[0]
 
-    return (await client.albums(track_id))[0]
+
+def normalize_search_query(query: str) -> str:
+    """
+    Normalizes a search query so that trivially different spellings share a cache entry.
+    """
+
+    query = unicodedata.normalize("NFKC", query).casefold().replace("ё", "е")
+    return " ".join(query.split())
 
 
 async def search_request(user_id: int, query: str, type_of_search: str):
     """
     Performs a search on Yandex Music for "track" or "album".
+    Returns up to SEARCH_RESULTS_LIMIT rows (id, first artist, title) and the total
+    number of results. Results are cached by normalized query and type of search.
     """
 
+    key = (type_of_search, normalize_search_query(query))
+    cached = search_cache.get(key)
+    if cached is not None:
+        return cached
+
     client = await get_yandex_music_client(user_id)
 
-    return (
-        (await client.search(query)).tracks
-        if type_of_search == "track"
-        else (await client.search(query)).albums
-    )
+    try:
+        search = await client.search(query, type_=type_of_search)
+    except yandex_music.exceptions.UnauthorizedError as e:
+        raise token_rejected(user_id, e) from e
+    results = search.tracks if type_of_search == "track" else search.albums
 
+    if results is None:
+        result = ([], 0)
+    else:
+        result = (
+            [
+                (
+                    music.id,
+                    music.artists[0].name if music.artists else "",
+                    music.title,
+                )
+                for music in results.results[:SEARCH_RESULTS_LIMIT]
+            ],
+            results.total,
+        )
 
-async def update_tracks(client: ClientAsync, playlist, user_id: int, group_id: int):
+    search_cache.set(key, result)
+    return result
+
+
+def group_sync_lock(group_id: int):
     """
-    Syncs playlist in Yandex Music with new tracks added to the group.
+    Lock of the group's tracks and playlists, held across all bot processes: a group
+    is reconciled by one sync job or user request at a time, so tracks pulled from
+    Yandex Music are only inserted once, and a deleted track isn't pushed back.
     """
 
-    track_list_pl = (await client.users_playlists(playlist.kind)).tracks
-    existing_track_ids_ym = {track.id for track in track_list_pl}
+    return database.lock(f"reconcile_group:{group_id}")
 
-    for track in database.get_group_sharing(group_id):
-        if track.type_of_music != "track":
-            continue
 
-        if track.yandex_id in existing_track_ids_ym:
-            continue
+def is_revision_conflict(error: yandex_music.exceptions.YandexMusicError) -> bool:
+    """Checks if a playlist change was rejected because the revision is outdated."""
 
-        track_info = await get_track_info(user_id, track.yandex_id)
+    return "revision" in str(error).lower()
 
-        # After each added track the revision changes
-        updated_playlist = await client.users_playlists(kind=playlist.kind)
 
-        await client.users_playlists_insert_track(
-            kind=playlist.kind,
-            track_id=track.yandex_id,
-            revision=updated_playlist.revision,
-            album_id=track_info.albums[0].id,
-        )
+async def apply_playlist_diff(
+    client: ClientAsync,
+    kind,
+    revision: int,
+    insert_tracks: Sequence[MusicInfo] = (),
+    delete_indexes: Sequence[int] = (),
+):
+    """
+    Applies deletions and insertions to a playlist as `change` requests against one
+    revision: deletions and the first chunk of insertions go in the first request,
+    further chunks of PLAYLIST_CHANGE_CHUNK_SIZE tracks follow, each with the revision
+    returned by the previous request. Tracks are given oldest first and end up on top
+    of the playlist newest first. Returns the changed playlist (or None if the diff
+    is empty).
+    """
 
+    diffs = [Difference()]
+
+    # Deleting from the end keeps the remaining indexes valid
+    for index in sorted(set(delete_indexes), reverse=True):
+        diffs[0].add_delete(index, index + 1)
+
+    tracks = [
+        {"id": track.id, "album_id": track.album_id}
+        for track in reversed(insert_tracks)
+        if track.album_id is not None
+    ]
+    # Every chunk goes below the ones inserted before it
+    for start in range(0, len(tracks), PLAYLIST_CHANGE_CHUNK_SIZE):
+        if start:
+            diffs.append(Difference())
+        diffs[-1].add_insert(start, tracks[start : start + PLAYLIST_CHANGE_CHUNK_SIZE])
+
+    playlist = None
+    for diff in diffs:
+        if not diff.operations:
+            continue
+        playlist = await client.users_playlists_change(kind, diff.to_json(), revision)
+        revision = playlist.revision
 
-async def download_new_tracks_from_playlist(user_id: int, group_id: int):
+    return playlist
+
+
+async def update_tracks(client: ClientAsync, playlist, user_id: int, group_id: int):
     """
-    Inserts new tracks from the user's Yandex playlist into DB.
-    Also syncs the playlist across other group members' accounts.
+    Syncs playlist in Yandex Music with new tracks added to the group.
+    All missing tracks are added by one (chunked) diff; if the playlist was changed
+    meanwhile, the diff is recomputed and applied again.
     """
 
-    client = await get_yandex_music_client(user_id)
-    playlist = database.get_playlist(user_id, group_id)
+    group_track_ids = [
+        track.yandex_id
+        for track in await database.get_group_sharing(group_id)
+        if track.type_of_music == "track"
+    ]
+
+    for attempt in range(1, PLAYLIST_CHANGE_ATTEMPTS + 1):
+        playlist_ym = await client.users_playlists(playlist.kind)
+        existing_track_ids_ym = {str(track.id) for track in playlist_ym.tracks}
+
+        missing_track_ids = [
+            track_id
+            for track_id in group_track_ids
+            if str(track_id) not in existing_track_ids_ym
+        ]
+        if not missing_track_ids:
+            return
 
-    track_list_pl = (await client.users_playlists(playlist.kind)).tracks
-    existing_track_ids_db = {
-        music.yandex_id
-        for music in database.get_group_sharing(group_id)
-        if music.type_of_music == "track"
-    }
+        missing_tracks = await fetch_music(user_id, "track", missing_track_ids, client)
 
-    for track_pl in track_list_pl:
-        if track_pl.id in existing_track_ids_db:
-            continue
+        try:
+            await apply_playlist_diff(
+                client,
+                playlist.kind,
+                playlist_ym.revision,
+                insert_tracks=missing_tracks,
+            )
+            return
+        except yandex_music.exceptions.NetworkError as e:
+            if attempt == PLAYLIST_CHANGE_ATTEMPTS or not is_revision_conflict(e):
+                raise
+            logger.info(
+                "Revision conflict in playlist of user %d in group %d, retrying",
+                user_id,
+                group_id,
+            )
 
-        track_info = await get_track_info(user_id, track_pl.id)
 
-        database.insert_music(
-            yandex_id=track_pl.id,
-            title=f"{', '.join(artist.name for artist in track_info.artists)} — {track_info.title}",
-            type_of_music="track",
-            message="ДОБАВЛЕН ИЗ ПЛЕЙЛИСТА",
-            photo_uri=track_info.cover_uri,
-            user_id=user_id,
-            group_id=group_id,
-        )
+async def get_playlist_header(client: ClientAsync, kind):
+    """
+    Returns the user's playlist without its tracks (enough to read `revision` and
+    `track_count`), or None if the playlist no longer exists.
+    """
 
-        # Update playlists for other group members
-        for groupmate in database.get_group_users(group_id):
-            if groupmate.id != user_id and groupmate.token:
-                playlist_usr = database.get_playlist(groupmate.id, group_id)
-                groupmate_client = await get_yandex_music_client(groupmate.id)
+    for playlist in await client.users_playlists_list():
+        if str(playlist.kind) == str(kind):
+            return playlist
+    return None
 
-                await update_tracks(
-                    groupmate_client, playlist_usr, groupmate.id, group_id
-                )
 
+async def remove_track_from_playlist(client: ClientAsync, kind, track_id_ym: int):
+    """
+    Removes every occurrence of a track from a playlist with one diff.
+    The playlist is indexed by track id, so positions are found without scanning
+    it per track; on a revision conflict it is re-read and the diff is retried.
+    """
 
-async def delete_track_from_playlists(group_id: int, track_id: int):
-    """Removes a track from all users' playlists in a specified group."""
+    for attempt in range(1, PLAYLIST_CHANGE_ATTEMPTS + 1):
+        playlist = await client.users_playlists(kind)
 
-    track_id_ym = database.get_music_by_id(track_id).yandex_id
+        track_positions = {}
+        for index, track in enumerate(playlist.tracks):
+            track_positions.setdefault(str(track.id), []).append(index)
 
-    for user in database.get_group_users(group_id):
-        try:
-            playlist_usr = database.get_playlist(user.id, group_id)
-            user_client = await get_yandex_music_client(user.id)
+        indexes = track_positions.get(str(track_id_ym))
+        if not indexes:
+            return
 
-            playlist = await user_client.users_playlists(playlist_usr.kind)
-            track_list_pl = playlist.tracks
+        try:
+            await apply_playlist_diff(
+                client, kind, playlist.revision, delete_indexes=indexes
+            )
+            return
+        except yandex_music.exceptions.NetworkError as e:
+            if attempt == PLAYLIST_CHANGE_ATTEMPTS or not is_revision_conflict(e):
+                raise
 
-            track_info = await get_track_info(user.id, track_id_ym)
-            track_id = int(track_info.track_id.split(":")[0])
 
-            for index, _ in enumerate(track_list_pl):
-                if track_list_pl[index].id != track_id:
-                    continue
+async def delete_track_from_member_playlist(
+    user_id: int, group_id: int, track_id_ym: int, semaphore: asyncio.Semaphore
+):
+    """
+    Removes a track from a member's group playlist. Errors are logged,
+    so that one broken account doesn't affect the others.
+    """
 
-                await user_client.users_playlists_delete_track(
-                    kind=playlist_usr.kind,
-                    from_=index,
-                    to=(index + 1),  # idk why this is so...
-                    revision=playlist.revision,
-                )
-                break
+    playlist_usr = await database.get_playlist(user_id, group_id)
+    if playlist_usr is None:
+        return
 
-        except (yandex_music.exceptions.YandexMusicError, AttributeError) as e:
+    async with semaphore:
+        try:
+            user_client = await get_yandex_music_client(user_id)
+            await remove_track_from_playlist(
+                user_client, playlist_usr.kind, track_id_ym
+            )
+        except (ValueError, yandex_music.exceptions.YandexMusicError) as e:
+            report_auth_failure(user_id, e)
             logger.error(
                 "Failed to delete track for user %d in group %d: %s",
-                user.id,
+                user_id,
                 group_id,
                 e,
             )
 
 
-async def create_or_update_playlist(user_id: int, group_id: int, title: str = ""):
+async def delete_group_track(group_id: int, track_id: int):
     """
-    Creates or updates a group playlist. If playlist doesn't exist — creates one.
+    Removes a track from all users' playlists in a specified group, then from DB.
+    Members' playlists are processed concurrently, at most PLAYLIST_DELETE_CONCURRENCY
+    at a time. The group is locked meanwhile, so that a sync doesn't see the track
+    still in DB and put it back into the playlists.
     """
 
-    client = await get_yandex_music_client(user_id)
+    async with group_sync_lock(group_id):
+        track_id_ym = (await database.get_music_by_id(track_id)).yandex_id
+        semaphore = asyncio.Semaphore(PLAYLIST_DELETE_CONCURRENCY)
 
-    playlist = database.get_playlist(user_id, group_id)
-    if not playlist:
-        if title:
-            playlist = await client.users_playlists_create(title)
-            database.create_playlist_for_user_in_group(
-                user_id, group_id, playlist.kind, playlist.owner.uid
+        await asyncio.gather(
+            *(
+                delete_track_from_member_playlist(
+                    user.id, group_id, track_id_ym, semaphore
+                )
+                for user in await database.get_group_users(group_id)
+                if not circuit_breaker.is_open(user.id)
             )
-        else:
-            return
+        )
+        await database.delete_track(track_id)
+
+
+class MemberPlaylist:
+    """
+    A group member's playlist as read by `reconcile_group`.
+    `track_ids` is None if the playlist is unchanged since the last sync, which means
+    it holds exactly the group's tracks as of that sync.
+    """
+
+    def __init__(
+        self,
+        *,
+        user_id: int,
+        client: ClientAsync,
+        kind,
+        revision: int,
+        track_count: int,
+        track_ids: set[str] | None,
+    ):
+        self.user_id = user_id
+        self.client = client
+        self.kind = kind
+        self.revision = revision
+        self.track_count = track_count
+        self.track_ids = track_ids
+
+
+async def read_member_playlist(
+    user_id: int, group_id: int, music_state: str
+) -> MemberPlaylist | None:
+    """
+    Reads a member's group playlist, downloading its tracks only if it changed since
+    the last sync. Recreates the playlist if it was deleted in Yandex Music.
+    Returns None if the member has no playlist for this group.
+    """
+
+    playlist = await database.get_playlist(user_id, group_id)
+    if playlist is None:
+        return None
+
+    client = await get_yandex_music_client(user_id)
+    playlist_header = await get_playlist_header(client, playlist.kind)
+
+    # If playlist not found
+    if playlist_header is None:
+        group_name = await database.get_group_name(group_id)
+        playlist_ym = await client.users_playlists_create(group_name)
+        await database.update_playlist_info(
+            user_id, group_id, playlist_ym.kind, playlist_ym.owner.uid
+        )
+        return MemberPlaylist(
+            user_id=user_id,
+            client=client,
+            kind=playlist_ym.kind,
+            revision=playlist_ym.revision,
+            track_count=0,
+            track_ids=set(),
+        )
+
+    if (
+        playlist_header.revision == playlist.revision
+        and playlist_header.track_count == playlist.track_count
+        and music_state == playlist.music_state
+    ):
+        return MemberPlaylist(
+            user_id=user_id,
+            client=client,
+            kind=playlist.kind,
+            revision=playlist.revision,
+            track_count=playlist.track_count,
+            track_ids=None,
+        )
+
+    playlist_ym = await client.users_playlists(playlist.kind)
+    return MemberPlaylist(
+        user_id=user_id,
+        client=client,
+        kind=playlist.kind,
+        revision=playlist_ym.revision,
+        track_count=playlist_ym.track_count,
+        track_ids={str(track.id) for track in playlist_ym.tracks},
+    )
+
+
+async def push_member_delta(
+    member: MemberPlaylist,
+    group_id: int,
+    group_track_ids: list[str],
+    new_track_ids: list[str],
+    music_state: str,
+):
+    """
+    Adds the group's tracks missing from a member's playlist with one diff
+    and remembers the resulting playlist state for the next sync.
+    """
+
+    if member.track_ids is None:
+        missing_track_ids = new_track_ids
     else:
+        missing_track_ids = [
+            track_id for track_id in group_track_ids if track_id not in member.track_ids
+        ]
+    # The playlist counts as synced without them, which keeps it in the
+    # unchanged-playlist shortcut
+    missing_track_ids = [
+        track_id
+        for track_id in missing_track_ids
+        if unsyncable_tracks.get(track_id) is None
+    ]
+
+    revision, track_count = member.revision, member.track_count
+    if missing_track_ids:
+        missing_tracks = await fetch_music(
+            member.user_id, "track", missing_track_ids, member.client
+        )
+        insertable_track_ids = {
+            str(track.id) for track in missing_tracks if track.album_id is not None
+        }
+        unsyncable_track_ids = [
+            track_id
+            for track_id in missing_track_ids
+            if track_id not in insertable_track_ids
+        ]
+        if unsyncable_track_ids:
+            logger.warning(
+                "%d tracks of group %d can't be added to playlists: %s",
+                len(unsyncable_track_ids),
+                group_id,
+                ", ".join(unsyncable_track_ids),
+            )
+            for track_id in unsyncable_track_ids:
+                unsyncable_tracks.set(track_id, True)
         try:
-            await client.users_playlists(playlist.kind)
-
-        # If playlist not found
-        # For some reason it returns exception, not 'None'
-        except yandex_music.exceptions.NotFoundError:
-            group_name = database.get_group_name(group_id)
-            playlist = await client.users_playlists_create(group_name)
-            database.update_playlist_info(
-                user_id, group_id, playlist.kind, playlist.owner.uid
+            playlist_ym = await apply_playlist_diff(
+                member.client,
+                member.kind,
+                member.revision,
+                insert_tracks=missing_tracks,
+            )
+        except yandex_music.exceptions.NetworkError as e:
+            if not is_revision_conflict(e):
+                raise
+            # The member changed the playlist meanwhile: re-read it and retry,
+            # its new tracks will be pulled on the next pass
+            await database.update_playlist_sync_state(
+                member.user_id, group_id, None, None, None
             )
+            await update_tracks(member.client, member, member.user_id, group_id)
+            return
 
-    await update_tracks(client, playlist, user_id, group_id)
-    await download_new_tracks_from_playlist(user_id, group_id)
+        if playlist_ym is not None:
+            revision, track_count = playlist_ym.revision, playlist_ym.track_count
 
+    await database.update_playlist_sync_state(
+        member.user_id, group_id, revision, track_count, music_state
+    )
 
-async def playlist_update_job(_):
+
+async def reconcile_group(group_id: int):
     """
-    Scheduled job that runs periodically to sync all users` playlists with their groups.
+    Syncs the group's tracks with the playlists of all its members in one pass:
+    each member's playlist is read once, tracks that members added in Yandex Music
+    are inserted into DB, and then every member gets exactly the tracks they miss.
     """
 
-    logger.info("Playlist update via JobQueue started")
+    async with group_sync_lock(group_id):
+        music_state = await database.get_group_music_state(group_id)
+        members = [
+            user.id
+            for user in await database.get_group_users(group_id)
+            if user.token and not circuit_breaker.is_open(user.id)
+        ]
+
+        members_playlists = []
+        results = await asyncio.gather(
+            *(
+                read_member_playlist(user_id, group_id, music_state)
+                for user_id in members
+            ),
+            return_exceptions=True,
+        )
+        for user_id, result in zip(members, results):
+            if isinstance(
+                result, (ValueError, yandex_music.exceptions.YandexMusicError)
+            ):
+                report_auth_failure(user_id, result)
+                logger.error(
+                    "Failed to read playlist of user %d in group %d: %s",
+                    user_id,
+                    group_id,
+                    result,
+                )
+            elif isinstance(result, BaseException):
+                raise result
+            elif result is not None:
+                members_playlists.append(result)
+
+        # Pull tracks that members added to their playlists in Yandex Music
+        group_track_ids = [
+            str(music.yandex_id)
+            for music in await database.get_group_sharing(group_id)
+            if music.type_of_music == "track"
+        ]
+        known_track_ids = set(group_track_ids)
+        new_track_ids = []
+        for member in members_playlists:
+            if member.track_ids is None:
+                continue
+
+            member_new_track_ids = [
+                track_id
+                for track_id in member.track_ids
+                if track_id not in known_track_ids
+            ]
+            if not member_new_track_ids:
+                continue
+            known_track_ids.update(member_new_track_ids)
+
+            new_tracks = await fetch_music(
+                member.user_id, "track", member_new_track_ids, member.client
+            )
+            inserted_track_ids = await database.insert_new_group_tracks(
+                group_id,
+                [
+                    {
+                        "yandex_id": track_info.id,
+                        "title": track_info.full_title,
+                        "album_id": track_info.album_id,
+                        "artists": track_info.artists,
+                        "message": "ДОБАВЛЕН ИЗ ПЛЕЙЛИСТА",
+                        "photo_uri": track_info.cover_uri,
+                        "user_id": member.user_id,
+                    }
+                    for track_info in new_tracks
+                ],
+            )
+            new_track_ids.extend(str(track_id) for track_id in inserted_track_ids)
+
+        # Push to every member exactly the tracks they miss
+        group_track_ids += new_track_ids
+        music_state = await database.get_group_music_state(group_id)
+        results = await asyncio.gather(
+            *(
+                push_member_delta(
+                    member, group_id, group_track_ids, new_track_ids, music_state
+                )
+                for member in members_playlists
+            ),
+            return_exceptions=True,
+        )
+        for member, result in zip(members_playlists, results):
+            if isinstance(
+                result, (ValueError, yandex_music.exceptions.YandexMusicError)
+            ):
+                report_auth_failure(member.user_id, result)
+                logger.error(
+                    "Failed to update playlist of user %d in group %d: %s",
+                    member.user_id,
+                    group_id,
+                    result,
+                )
+            elif isinstance(result, BaseException):
+                raise result
+
 
-    users = database.get_all_users()
-    for user in users:
-        for group in database.get_user_groups(user.id):
+async def create_or_update_playlist(user_id: int, group_id: int, title: str):
+    """
+    Creates the user's group playlist if it doesn't exist, then syncs the group.
+    """
+
+    client = await get_yandex_music_client(user_id)
+
+    if not await database.get_playlist(user_id, group_id):
+        playlist = await client.users_playlists_create(title)
+        await database.create_playlist_for_user_in_group(
+            user_id, group_id, playlist.kind, playlist.owner.uid
+        )
+
+    await reconcile_group(group_id)
+
+
+async def backfill_music_metadata_job(_):
+    """
+    One-off job that fills album id and artists of music shared before they were
+    stored in the DB. Rows are resolved in batches per sharer, one transaction per batch.
+    Each row is looked up once: rows Yandex Music doesn't return, or whose batch
+    failed, are recorded as attempted and left without metadata.
+    """
+
+    rows_by_key = {}
+    for music in await database.get_music_without_metadata():
+        rows_by_key.setdefault((music.user_id, music.type_of_music), []).append(music)
+
+    for (user_id, type_of_music), rows in rows_by_key.items():
+        for start in range(0, len(rows), METADATA_CHUNK_SIZE):
+            batch = rows[start : start + METADATA_CHUNK_SIZE]
+            music_ids = [music.id for music in batch]
             try:
-                await create_or_update_playlist(user.id, group.id)
-                logger.info(
-                    "Updated playlist for user %d in group %d", user.id, group.id
+                infos = await fetch_music(
+                    user_id, type_of_music, [music.yandex_id for music in batch]
                 )
-            except (yandex_music.exceptions.YandexMusicError, AttributeError) as e:
+            except (ValueError, yandex_music.exceptions.YandexMusicError) as e:
                 logger.error(
-                    "Failed to update playlist for user %d in group %d: %s",
-                    user.id,
-                    group.id,
-                    e,
+                    "Failed to backfill music metadata for user %d: %s", user_id, e
                 )
+                await database.update_music_metadata(music_ids, {})
+                break
+
+            infos_by_id = {info.id: info for info in infos}
+            await database.update_music_metadata(
+                music_ids,
+                {
+                    music.id: (
+                        infos_by_id[music.yandex_id].album_id,
+                        infos_by_id[music.yandex_id].artists,
+                    )
+                    for music in batch
+                    if music.yandex_id in infos_by_id
+                },
+            )
+
+    logger.info("Music metadata backfill finished")
+
+
+async def sync_group_playlists(group_id: int, semaphore: asyncio.Semaphore) -> str:
+    """
+    Syncs one group as a single task of `playlist_update_job`.
+    Errors are logged and reported as the task outcome instead of being raised,
+    so one broken group doesn't stop the pass.
+    """
+
+    async with semaphore:
+        try:
+            await asyncio.wait_for(reconcile_group(group_id), SYNC_TASK_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error("Timed out updating playlists in group %d", group_id)
+            return "timed_out"
+        except Exception:  # pylint: disable=W0718
+            logger.exception("Failed to update playlists in group %d", group_id)
+            return "failed"
+
+    logger.info("Updated playlists in group %d", group_id)
+    return "updated"
+
+
+async def playlist_update_job(_):
+    """
+    Scheduled job that runs periodically to sync all users` playlists with their groups.
+    Groups are reconciled concurrently, at most SYNC_CONCURRENCY at a time.
+    """
+
+    logger.info("Playlist update via JobQueue started")
+    started_at = time.monotonic()
+
+    semaphore = asyncio.Semaphore(SYNC_CONCURRENCY)
+    group_ids = [group.id for group in await database.get_all_groups()]
+    outcomes = Counter(
+        await asyncio.gather(
+            *(sync_group_playlists(group_id, semaphore) for group_id in group_ids)
+        )
+    )
+
+    logger.info(
+        "Playlist update finished in %.1f s: %d groups, %d updated, %d failed, "
+        "%d timed out. Yandex Music requests so far: %s",
+        time.monotonic() - started_at,
+        len(group_ids),
+        outcomes["updated"],
+        outcomes["failed"],
+        outcomes["timed_out"],
+        governor.stats(),
+    )
@@ -11,6 +11,7 @@ from bot.common_handlers import logger, group_selection
 from bot.history import format_music_entry
 from bot.utils import (
     database,
+    rating_queue,
     fix_yandex_image_uri,
     send_or_edit_message,
     build_paginated_keyboard,
@@ -28,7 +29,7 @@ async def rate_track_handler(update: Update, _) -> int:
     query = update.callback_query
     await query.answer()
 
-    reply_markup = group_selection(user, "rate")
+    reply_markup = await group_selection(user, "rate")
     await query.edit_message_text(
         "Выберите группу, в которой хотите оценить трек", reply_markup=reply_markup
     )
@@ -52,7 +53,7 @@ async def choose_track_handler(update: Update, context: ContextTypes.DEFAULT_TYP
 
     tracks = [
         (music.title, music.id)
-        for music in database.get_group_sharing(group_id)
+        for music in await database.get_group_sharing(group_id)
         if music.type_of_music == "track" and music.user_id != user.id
     ]
 
@@ -93,7 +94,8 @@ async def chosen_track_handler(update: Update, context: ContextTypes.DEFAULT_TYP
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
 
-    track = database.get_music_by_id(track_id)
+    await rating_queue.flush_user(user.id)
+    track = await database.get_music_by_id(track_id)
     text = await format_music_entry(track, is_group=False)
 
     await query.edit_message_media(
@@ -120,7 +122,7 @@ async def change_rating_handler(update: Update, _):
     mark = int(callback_data.split("_")[1])
     track_id = int(callback_data.split("_")[2])
 
-    database.rate_music(user.id, track_id, mark)
+    await rating_queue.put(user.id, track_id, mark)
 
     keyboard = [
         [InlineKeyboardButton("🔙 Назад", callback_data=str(CallbackData.MENU.value))],
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+
+from bot.settings import RATING_FLUSH_INTERVAL, RATING_FLUSH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class RatingQueue:
+    """
+    Write-behind queue of rating votes.
+
+    Votes are kept in memory keyed by (user_id, music_id), so a user changing
+    their mark only leaves the last one, and are written in a single transaction
+    `interval` seconds after the first pending vote or as soon as `max_size`
+    votes are pending.
+    """
+
+    def __init__(
+        self,
+        database,
+        interval: float = RATING_FLUSH_INTERVAL,
+        max_size: int = RATING_FLUSH_SIZE,
+    ):
+        self.database = database
+        self.interval = interval
+        self.max_size = max_size
+        self._pending = {}  # (user_id, music_id) -> rating
+        self._lock = asyncio.Lock()
+        self._timer = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def put(self, user_id: int, music_id: int, rating: int) -> None:
+        """Queues a vote, replacing the user's pending vote for the same music."""
+
+        self._pending[(user_id, music_id)] = rating
+        if len(self._pending) >= self.max_size:
+            await self._try_flush()
+        else:
+            self._schedule()
+
+    def _schedule(self) -> None:
+        """Starts the timer of a scheduled flush unless one is running."""
+        if self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.interval)
+        self._timer = None
+        await self._try_flush()
+
+    async def _try_flush(self) -> None:
+        """
+        Flushes for the handlers and the timer, which must not fail because of
+        the DB: the error is logged and the votes are retried by a scheduled flush.
+        """
+        try:
+            await self.flush()
+        except Exception:  # pylint: disable=W0718
+            logger.exception("Failed to write %d rating votes", len(self._pending))
+            if self._pending:
+                self._schedule()
+
+    async def flush(self) -> None:
+        """Writes all pending votes. Failed votes stay queued unless re-voted."""
+
+        async with self._lock:
+            if not self._pending:
+                return
+            ratings, self._pending = self._pending, {}
+            try:
+                await self.database.rate_music_batch(ratings)
+            except Exception:
+                for key, rating in ratings.items():
+                    self._pending.setdefault(key, rating)
+                raise
+
+    async def flush_user(self, user_id: int) -> None:
+        """
+        Writes the queue out if the user has votes pending or being written,
+        so that a following read sees them.
+        """
+
+        if self._lock.locked() or any(key[0] == user_id for key in self._pending):
+            await self._try_flush()
+
+    async def close(self) -> None:
+        """
+        Stops the timer and writes the remaining votes (on shutdown),
+        raising if they can't be written.
+        """
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
@@ -0,0 +1,96 @@
+from sqlalchemy import Float, cast, func, select, update
+
+from bot.models import Music, MusicRating, User
+
+
+async def update_average_rating(
+    session, music_id: int, rating_delta: int, count_delta: int
+):
+    """
+    Applies a rating change to the running aggregates of the music and of the
+    user who shared it, within the given session.
+    """
+    music = await session.get(Music, music_id, with_for_update=True)
+    old_count, old_average = music.count_of_ratings, music.average_mark
+
+    music.sum_of_ratings += rating_delta
+    music.count_of_ratings += count_delta
+    music.average_mark = music.sum_of_ratings / music.count_of_ratings
+
+    await session.execute(
+        update(User)
+        .where(User.id == music.user_id)
+        .values(
+            count_of_rated_shared=User.count_of_rated_shared + (0 if old_count else 1),
+            sum_of_shared_marks=User.sum_of_shared_marks
+            + music.average_mark
+            - (old_average if old_count else 0),
+        )
+    )
+
+
+async def apply_rating(session, user_id: int, music_id: int, rating: int) -> None:
+    """Upserts a single rating and its running aggregates within the session."""
+    existing_rating = await session.scalar(
+        select(MusicRating).where(
+            MusicRating.user_id == user_id, MusicRating.music_id == music_id
+        )
+    )
+
+    if existing_rating:
+        rating_delta, count_delta = rating - existing_rating.rating, 0
+        existing_rating.rating = rating
+    else:
+        rating_delta, count_delta = rating, 1
+        session.add(MusicRating(user_id=user_id, music_id=music_id, rating=rating))
+
+    await session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(
+            count_of_ratings=User.count_of_ratings + count_delta,
+            sum_of_ratings=User.sum_of_ratings + rating_delta,
+        )
+    )
+    await update_average_rating(session, music_id, rating_delta, count_delta)
+
+
+def rebuild_rating_aggregates(connection) -> None:
+    """
+    Rebuilds the running rating aggregates of all music and users from
+    the MusicRating table, on a sync connection.
+    """
+
+    def ratings_of(column):
+        return (
+            select(func.coalesce(func.sum(MusicRating.rating), 0))
+            .where(column)
+            .scalar_subquery(),
+            select(func.count(MusicRating.id)).where(column).scalar_subquery(),
+        )
+
+    music_sum, music_count = ratings_of(MusicRating.music_id == Music.id)
+    user_sum, user_count = ratings_of(MusicRating.user_id == User.id)
+    rated_shared = (Music.user_id == User.id, Music.count_of_ratings > 0)
+
+    connection.execute(
+        update(Music).values(
+            sum_of_ratings=music_sum,
+            count_of_ratings=music_count,
+            average_mark=func.coalesce(
+                cast(music_sum, Float) / func.nullif(music_count, 0), 0
+            ),
+        )
+    )
+    connection.execute(
+        update(User).values(
+            sum_of_ratings=user_sum,
+            count_of_ratings=user_count,
+            count_of_rated_shared=select(func.count(Music.id))
+            .where(*rated_shared)
+            .scalar_subquery(),
+            sum_of_shared_marks=select(func.coalesce(func.sum(Music.average_mark), 0))
+            .where(*rated_shared)
+            .scalar_subquery(),
+        )
+    )
@@ -0,0 +1,28 @@
+import asyncio
+import logging
+
+from bot.utils import database
+
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+
+async def recompute_ratings():
+    """
+    Rebuilds the running rating aggregates of music and users from the ratings.
+    Run it once if the average marks or the account statistics drifted:
+
+        python3 -m bot.recompute_ratings
+    """
+
+    try:
+        await database.recompute_rating_aggregates()
+    finally:
+        await database.close()
+    logger.info("Rating aggregates recomputed")
+
+
+if __name__ == "__main__":
+    asyncio.run(recompute_ratings())
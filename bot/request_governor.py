@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import random
+import re
+import time
+from collections import Counter, OrderedDict
+
+from yandex_music.exceptions import NetworkError, TimedOutError
+from yandex_music.utils.request_async import Request
+
+from bot.settings import (
+    YANDEX_RATE,
+    YANDEX_BURST,
+    YANDEX_TOKEN_RATE,
+    YANDEX_TOKEN_BURST,
+    YANDEX_MAX_RETRIES,
+    YANDEX_RETRY_RATE,
+    YANDEX_RETRY_BURST,
+    YANDEX_BACKOFF_BASE,
+    YANDEX_BACKOFF_MAX,
+)
+
+logger = logging.getLogger(__name__)
+
+# yandex_music puts the HTTP status into the message of unexpected responses
+STATUS_PATTERN = re.compile(r"\((\d{3})\)")
+TRANSIENT_STATUSES = {500, 502, 503, 504}
+MAX_TOKEN_BUCKETS = 4096
+# POST requests that are safe to resend after a timeout or a 5xx: reads sent as
+# POST (tracks, albums, playlists by kind) and playlist changes, which are guarded
+# by the revision (a change that went through fails again with "wrong-revision")
+IDEMPOTENT_POST_PATTERN = re.compile(
+    r"/(tracks|albums|playlists/list|users/[^/]+/playlists(/[^/]+/change)?)$"
+)
+
+
+class TokenBucket:
+    """
+    Token bucket: allows `rate` operations per second with bursts up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def try_take(self) -> bool:
+        """Takes a token if one is available right now."""
+
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def take(self) -> float:
+        """Waits until a token is available and takes it. Returns the time waited."""
+
+        waited = 0.0
+        while not self.try_take():
+            delay = (1 - self.tokens) / self.rate
+            await asyncio.sleep(delay)
+            waited += delay
+        return waited
+
+
+class TokenBuckets:
+    """
+    Token buckets of individual Yandex Music tokens, created on first use;
+    beyond `max_size` the least recently used one is dropped.
+    """
+
+    def __init__(self, rate: float, capacity: int, max_size: int = MAX_TOKEN_BUCKETS):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_size = max_size
+        self._buckets = OrderedDict()
+
+    def get(self, token: str) -> TokenBucket:
+        """Returns the bucket of the token."""
+
+        bucket = self._buckets.get(token)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.capacity)
+            self._buckets[token] = bucket
+            while len(self._buckets) > self.max_size:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(token)
+        return bucket
+
+
+class RequestGovernor:
+    """
+    Central throttling and retry policy for all Yandex Music requests:
+    a global and a per-token token bucket, jittered exponential backoff on
+    throttling and transient errors, and a global retry budget.
+    """
+
+    def __init__(
+        self,
+        *,
+        rate: float = YANDEX_RATE,
+        burst: int = YANDEX_BURST,
+        token_rate: float = YANDEX_TOKEN_RATE,
+        token_burst: int = YANDEX_TOKEN_BURST,
+        max_retries: int = YANDEX_MAX_RETRIES,
+        retry_rate: float = YANDEX_RETRY_RATE,
+        retry_burst: int = YANDEX_RETRY_BURST,
+        backoff_base: float = YANDEX_BACKOFF_BASE,
+        backoff_max: float = YANDEX_BACKOFF_MAX,
+    ):
+        self.global_bucket = TokenBucket(rate, burst)
+        self.token_buckets = TokenBuckets(token_rate, token_burst)
+        self.retry_budget = TokenBucket(retry_rate, retry_burst)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.counters = Counter()
+
+    async def acquire(self, token: str | None) -> None:
+        """Waits for the per-token bucket, then for the global one."""
+
+        waited = 0.0
+        if token:
+            waited += await self.token_buckets.get(token).take()
+        waited += await self.global_bucket.take()
+
+        self.counters["requests"] += 1
+        if waited:
+            self.counters["delayed"] += 1
+            self.counters["wait_ms"] += int(waited * 1000)
+
+    @staticmethod
+    def classify(error: Exception) -> str | None:
+        """Returns "throttled", "transient" or None (not worth retrying)."""
+
+        if isinstance(error, TimedOutError):
+            return "transient"
+        # Subclasses (unauthorized, bad request, not found) won't succeed on retry
+        if type(error) is not NetworkError:  # pylint: disable=C0123
+            return None
+
+        match = STATUS_PATTERN.search(str(error))
+        if match:
+            status = int(match.group(1))
+            if status == 429:
+                return "throttled"
+            return "transient" if status in TRANSIENT_STATUSES else None
+
+        # Connection problems and 502 come without a status in the message
+        if error.__cause__ is not None or str(error) == "Bad Gateway":
+            return "transient"
+        return None
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given retry attempt (from 1)."""
+
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        )
+
+    async def run(self, token: str | None, send, idempotent: bool = True):
+        """
+        Sends a request through the governor, retrying it when it makes sense.
+        A throttled request was not processed and is always retried; after a
+        transient error only an idempotent one is, since the first attempt
+        may have gone through.
+        """
+
+        attempt = 0
+        while True:
+            await self.acquire(token)
+            try:
+                return await send()
+            except NetworkError as e:
+                kind = self.classify(e)
+                if kind is None or (kind == "transient" and not idempotent):
+                    raise
+
+                self.counters[kind] += 1
+                attempt += 1
+                if attempt > self.max_retries:
+                    self.counters["retries_exhausted"] += 1
+                    raise
+                if not self.retry_budget.try_take():
+                    self.counters["retry_budget_exhausted"] += 1
+                    raise
+
+                delay = self.backoff(attempt)
+                self.counters["retries"] += 1
+                logger.warning(
+                    "Yandex Music request %s (%s), retry %d in %.2f s",
+                    kind,
+                    e,
+                    attempt,
+                    delay,
+                )
+                await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        """Returns a snapshot of the governor counters."""
+
+        return dict(self.counters)
+
+
+class GovernedRequest(Request):
+    """
+    `yandex_music` request helper that sends every request through the governor.
+    """
+
+    def __init__(self, request_governor: RequestGovernor, *args, **kwargs):
+        self.governor = request_governor
+        self.token = None
+        super().__init__(*args, **kwargs)
+
+    def set_authorization(self, token: str) -> None:
+        self.token = token
+        super().set_authorization(token)
+
+    async def _request_wrapper(self, *args, **kwargs):
+        send = super()._request_wrapper
+
+        async def send_once():
+            return await send(*args, **kwargs)
+
+        idempotent = args[0] == "GET" or bool(IDEMPOTENT_POST_PATTERN.search(args[1]))
+        return await self.governor.run(self.token, send_once, idempotent)
+
+
+governor = RequestGovernor()
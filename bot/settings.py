@@ -0,0 +1,68 @@
+from decouple import config
+
+# Yandex Music API (point at a local stand-in, e.g. benchmarks/fake_yandex_music.py)
+YANDEX_API_URL = config("YANDEX_API_URL", default="https://api.music.yandex.net")
+
+# Database: SQLite by default, PostgreSQL (postgresql+asyncpg://...) to share
+# the state between several bot processes
+DATABASE_URL = config("DATABASE_URL", default="sqlite+aiosqlite:///Database.db")
+DATABASE_POOL_SIZE = config("DATABASE_POOL_SIZE", default=5, cast=int)
+DATABASE_MAX_OVERFLOW = config("DATABASE_MAX_OVERFLOW", default=10, cast=int)
+
+# SQLite profile, applied to every new DB connection
+SQLITE_JOURNAL_MODE = config("SQLITE_JOURNAL_MODE", default="WAL")
+SQLITE_SYNCHRONOUS = config("SQLITE_SYNCHRONOUS", default="NORMAL")
+SQLITE_CACHE_SIZE = config("SQLITE_CACHE_SIZE", default=-64_000, cast=int)  # < 0: KiB
+SQLITE_MMAP_SIZE = config("SQLITE_MMAP_SIZE", default=256 * 1024 * 1024, cast=int)
+SQLITE_TEMP_STORE = config("SQLITE_TEMP_STORE", default="MEMORY")
+SQLITE_BUSY_TIMEOUT = config("SQLITE_BUSY_TIMEOUT", default=5000, cast=int)  # ms
+
+# Sharing history
+HISTORY_PAGE_SIZE = config("HISTORY_PAGE_SIZE", default=10, cast=int)
+
+# Usernames, group names and members cached for rendering. A shared database
+# is changed by other processes too, which can't drop this process's entries
+IDENTITY_CACHE_SIZE = config("IDENTITY_CACHE_SIZE", default=4096, cast=int)
+IDENTITY_CACHE_TTL = config(
+    "IDENTITY_CACHE_TTL",
+    default=60 * 60 if DATABASE_URL.startswith("sqlite") else 30,
+    cast=int,
+)
+
+# Write-behind queue of rating votes
+RATING_FLUSH_INTERVAL = config("RATING_FLUSH_INTERVAL", default=0.3, cast=float)
+RATING_FLUSH_SIZE = config("RATING_FLUSH_SIZE", default=100, cast=int)
+
+# Yandex Music client pool
+CLIENT_POOL_SIZE = config("CLIENT_POOL_SIZE", default=256, cast=int)
+CLIENT_POOL_TTL = config("CLIENT_POOL_TTL", default=30 * 60, cast=int)  # seconds
+
+# Track/album metadata cache
+METADATA_CACHE_SIZE = config("METADATA_CACHE_SIZE", default=4096, cast=int)
+METADATA_CACHE_DB_SIZE = config("METADATA_CACHE_DB_SIZE", default=100_000, cast=int)
+METADATA_CACHE_TTL = config("METADATA_CACHE_TTL", default=7 * 24 * 60 * 60, cast=int)
+
+# Playlist sync job
+SYNC_INTERVAL = config("SYNC_INTERVAL", default=100, cast=int)  # seconds
+SYNC_CONCURRENCY = config("SYNC_CONCURRENCY", default=8, cast=int)
+SYNC_TASK_TIMEOUT = config("SYNC_TASK_TIMEOUT", default=120, cast=int)  # seconds
+
+# Yandex Music request governor
+YANDEX_RATE = config("YANDEX_RATE", default=20, cast=float)  # requests per second
+YANDEX_BURST = config("YANDEX_BURST", default=40, cast=int)
+YANDEX_TOKEN_RATE = config("YANDEX_TOKEN_RATE", default=5, cast=float)
+YANDEX_TOKEN_BURST = config("YANDEX_TOKEN_BURST", default=10, cast=int)
+YANDEX_MAX_RETRIES = config("YANDEX_MAX_RETRIES", default=3, cast=int)
+YANDEX_RETRY_RATE = config("YANDEX_RETRY_RATE", default=1, cast=float)  # per second
+YANDEX_RETRY_BURST = config("YANDEX_RETRY_BURST", default=10, cast=int)
+YANDEX_BACKOFF_BASE = config("YANDEX_BACKOFF_BASE", default=0.5, cast=float)
+YANDEX_BACKOFF_MAX = config("YANDEX_BACKOFF_MAX", default=10, cast=float)
+
+# Search results cache
+SEARCH_CACHE_SIZE = config("SEARCH_CACHE_SIZE", default=1024, cast=int)
+SEARCH_CACHE_TTL = config("SEARCH_CACHE_TTL", default=10 * 60, cast=int)  # seconds
+
+# Circuit breaker for broken Yandex Music tokens
+BREAKER_THRESHOLD = config("BREAKER_THRESHOLD", default=3, cast=int)
+BREAKER_BACKOFF_BASE = config("BREAKER_BACKOFF_BASE", default=5 * 60, cast=int)
+BREAKER_BACKOFF_MAX = config("BREAKER_BACKOFF_MAX", default=6 * 60 * 60, cast=int)
@@ -22,6 +22,7 @@ from bot.music import (
 )
 from bot.utils import (
     database,
+    rating_queue,
     format_users_of_group,
     fix_yandex_image_uri,
     format_message,
@@ -41,7 +42,7 @@ async def share_music_handler(update: Update, _) -> int:
     query = update.callback_query
     await query.answer()
 
-    reply_markup = group_selection(user, "share")
+    reply_markup = await group_selection(user, "share")
     await query.edit_message_text(
         "Выберите группу, с которой хотите поделиться", reply_markup=reply_markup
     )
@@ -86,7 +87,7 @@ async def choose_music_handler(update: Update, context: ContextTypes.DEFAULT_TYP
     reply_markup = InlineKeyboardMarkup(keyboard)
 
     await query.edit_message_text(
-        f"{format_users_of_group(group_id)}Выберите, чем хотите поделиться",
+        f"{await format_users_of_group(group_id)}Выберите, чем хотите поделиться",
         reply_markup=reply_markup,
     )
 
@@ -106,20 +107,14 @@ async def show_liked_track_handler(update: Update, context: ContextTypes.DEFAULT
     except ValueError as e:
         return await handle_error_with_back_button(update, str(e))
 
-    tracks = [
-        (
-            f"{', '.join(artist.name for artist in track.artists)} — {track.title}",
-            track.id,
-        )
-        for track in liked_tracks
-    ]
+    tracks = [(track.full_title, track.id) for track in liked_tracks]
 
     context.user_data["data"] = tracks
 
     reply_markup, _ = build_paginated_keyboard(tracks, page=0)
 
     await query.edit_message_text(
-        f"{format_users_of_group(context.user_data['share_group_id'])}Выберите трек",
+        f"{await format_users_of_group(context.user_data['share_group_id'])}Выберите трек",
         reply_markup=reply_markup,
     )
     return None
@@ -177,21 +172,22 @@ async def receive_search_query_handler(
     type_of_search = context.user_data["search"]
 
     try:
-        result_of_search = await search_request(user.id, user_message, type_of_search)
+        search_results, total = await search_request(
+            user.id, user_message, type_of_search
+        )
     except ValueError as e:
         return await handle_error_with_back_button(update, str(e))
 
-    count_of_results = min(result_of_search.total + 1, 7) - 1
+    count_of_results = min(total, len(search_results))
 
     keyboard = [
         [
             InlineKeyboardButton(
-                f"{result_of_search.results[i].artists[0].name} - "
-                f"{result_of_search.results[i].title}",
-                callback_data=f"chosen_{result_of_search.results[i].id}",
+                f"{artist} - {title}",
+                callback_data=f"chosen_{music_id}",
             )
         ]
-        for i in range(count_of_results)
+        for music_id, artist, title in search_results[:count_of_results]
     ]
     keyboard.append(
         [
@@ -297,7 +293,7 @@ async def receive_message_handler(
     yandex_id = context.user_data["yandex_id"]
     type_of_search = context.user_data.get("search", "track")
 
-    database.incr_count_of_sharing(user.id)
+    await database.incr_count_of_sharing(user.id)
 
     user_message = update.message.text
     music_info = (
@@ -308,11 +304,13 @@ async def receive_message_handler(
 
     photo_uri = fix_yandex_image_uri(music_info.cover_uri)
 
-    music_id = database.insert_music(
+    music_id = await database.insert_music(
         yandex_id=yandex_id,
-        title=f"{', '.join(artist.name for artist in music_info.artists)} — {music_info.title}",
+        title=music_info.full_title,
         message=user_message,
         type_of_music=type_of_search,
+        album_id=music_info.album_id,
+        artists=music_info.artists,
         photo_uri=photo_uri,
         user_id=user.id,
         group_id=group_id,
@@ -322,7 +320,7 @@ async def receive_message_handler(
         update,
         context.bot,
         music_id=music_id,
-        users=database.get_group_users(group_id),
+        users=await database.get_group_users(group_id),
         message_text=format_message(
             user.name, user_message, music_info, type_of_search
         ),
@@ -356,6 +354,6 @@ async def mark_callback_handler(update: Update, _):
     user = query.from_user
     logger.info("User %d selected mark %d", user.id, mark)
 
-    database.rate_music(user.id, music_id, mark)
+    await rating_queue.put(user.id, music_id, mark)
 
     await query.delete_message()
@@ -1,35 +1,40 @@
 import telegram
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes
-from yandex_music import Track
 
 from bot.constants import CallbackData
 from bot.database import Database
+from bot.metadata_cache import MusicInfo
+from bot.rating_queue import RatingQueue
 
 database = Database()
+rating_queue = RatingQueue(database)
 
 
-def format_groups_with_users(user_id: int) -> str:
+async def format_groups_with_users(user_id: int) -> str:
     """
     Formats the list of groups and their members for a given user into a readable string.
     """
 
-    user_groups = database.get_user_groups(user_id)
+    user_groups = await database.get_user_groups_with_users(user_id)
     return "\n\n".join(
         f"Группа: {group.name}\n\t\t\t\tУчастники: "
-        f"{', '.join(user.name for user in database.get_group_users(group.id))}"
+        f"{', '.join(user.name for user in group.users)}"
         for group in user_groups
     )
 
 
-def format_users_of_group(group_id: int) -> str:
+async def format_users_of_group(group_id: int) -> str:
     """
     Formats the information about a group and its members into a readable string.
     """
 
+    group = await database.get_group_with_users(group_id)
+    if group is None:
+        return ""
     return (
-        f"Группа: {database.get_group_name(group_id)}\n\t\t\t\tУчастники: "
-        f"{', '.join(user.name for user in database.get_group_users(group_id))}\n\n"
+        f"Группа: {group.name}\n\t\t\t\tУчастники: "
+        f"{', '.join(user.name for user in group.users)}\n\n"
     )
 
 
@@ -83,32 +88,43 @@ def fix_yandex_image_uri(url: str, size: str = "m1000x1000") -> str:
     return url
 
 
-def make_url_for_music(music_info: Track, type_of_search: str) -> str:
+def make_url_for_music(music_info: MusicInfo, type_of_search: str) -> str:
     """
     Generates a Yandex Music URL for the given music.
     """
 
     return (
-        f"https://music.yandex.ru/album/{music_info.albums[0].id}/track/{music_info.id}"
+        f"https://music.yandex.ru/album/{music_info.album_id}/track/{music_info.id}"
         if type_of_search == "track"
         else f"https://music.yandex.ru/album/{music_info.id}"
     )
 
 
-def format_track_name(music_info: Track, type_of_search: str) -> str:
+def make_url_for_shared_music(music) -> str:
+    """
+    Generates a Yandex Music URL for a music row from the DB without asking Yandex Music.
+    """
+
+    if music.type_of_music != "track":
+        return f"https://music.yandex.ru/album/{music.yandex_id}"
+    if music.album_id is None:
+        return f"https://music.yandex.ru/track/{music.yandex_id}"
+    return f"https://music.yandex.ru/album/{music.album_id}/track/{music.yandex_id}"
+
+
+def format_track_name(music_info: MusicInfo, type_of_search: str) -> str:
     """
     Formats a message with music information.
     """
 
     return (
         f'<a href="{make_url_for_music(music_info, type_of_search)}">'
-        f"{', '.join(artist.name for artist in music_info.artists)} — "
-        f"{music_info.title}</a>\n\n"
+        f"{music_info.full_title}</a>\n\n"
     )
 
 
 def format_message(
-    username: str, user_message: str, music_info: Track, type_of_search: str
+    username: str, user_message: str, music_info: MusicInfo, type_of_search: str
 ) -> str:
     """
     Formats a message with music information and user's comment.
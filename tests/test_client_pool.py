@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from bot import client_pool as client_pool_module
+from bot.client_pool import CircuitBreaker, ClientPool
+
+
+class Clock:
+    """Stands in for the `time` module, with a monotonic clock moved by hand."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        """Returns the current time of the clock."""
+        return self.now
+
+
+@pytest.fixture(name="clock")
+def fixture_clock(monkeypatch):
+    """The clock of the client pool and the circuit breaker."""
+
+    clock = Clock()
+    monkeypatch.setattr(client_pool_module, "time", clock)
+    return clock
+
+
+def test_circuit_breaker_opens_and_half_opens(clock):
+    """The circuit opens after `threshold` failures for a doubling backoff."""
+
+    breaker = CircuitBreaker(threshold=2, backoff_base=10, backoff_max=15)
+
+    breaker.record_failure(1)
+    assert not breaker.is_open(1)
+    breaker.record_failure(1)
+    assert breaker.is_open(1)
+    assert not breaker.is_open(2)
+
+    # Half-open: the next attempt is let through and fails again
+    clock.now += 10
+    assert not breaker.is_open(1)
+    breaker.record_failure(1)
+    assert breaker.is_open(1)
+
+    # The doubled backoff is capped at backoff_max
+    clock.now += 14
+    assert breaker.is_open(1)
+    clock.now += 1
+    assert not breaker.is_open(1)
+
+
+def test_circuit_breaker_closes(clock):
+    """A success or a token update closes the circuit and forgets the failures."""
+
+    breaker = CircuitBreaker(threshold=2, backoff_base=10, backoff_max=60)
+
+    breaker.record_failure(1)
+    breaker.record_failure(1)
+    clock.now += 10
+    breaker.record_success(1)
+    breaker.record_failure(1)
+    assert not breaker.is_open(1)
+
+    breaker.record_failure(1)
+    assert breaker.is_open(1)
+    breaker.reset(1)
+    assert not breaker.is_open(1)
+
+
+def test_client_pool_reuses_clients(clock, serve, yandex_music):
+    """A client is initialised once per token until it expires."""
+
+    pool = ClientPool(max_size=2, ttl=60)
+
+    async def main():
+        clients = await asyncio.gather(*(pool.get(1, "token-1") for _ in range(3)))
+        clock.now += 60
+        fresh = await pool.get(1, "token-1")
+        clock.now += 1
+        expired = await pool.get(1, "token-1")
+        return clients, fresh, expired
+
+    clients, fresh, expired = serve(main())
+    assert clients[0] is clients[1] is clients[2] is fresh
+    assert expired is not fresh
+    assert yandex_music.requests["/account/status"] == 2
+
+
+def test_client_pool_drops_client_of_changed_token(serve, yandex_music):
+    """A new token of the user gets a new client, and the old one is forgotten."""
+
+    pool = ClientPool(max_size=2, ttl=60)
+
+    async def main():
+        first = await pool.get(1, "token-1")
+        changed = await pool.get(1, "token-2")
+        again = await pool.get(1, "token-1")
+        return first, changed, again
+
+    first, changed, again = serve(main())
+    assert changed is not first and again is not first
+    assert changed.me.account.uid == yandex_music.accounts["token-2"].uid
+    assert yandex_music.requests["/account/status"] == 3
@@ -0,0 +1,311 @@
+import asyncio
+import random
+import time
+
+import pytest
+from sqlalchemy import func, select, text
+
+from bot.database import Database
+from bot.migrations import migrations
+from bot.models import Base, Music, engine
+from bot.rating_queue import RatingQueue
+
+BIG_ID = 7_000_000_001  # Telegram ids exceed 32 bits
+
+postgresql_only = pytest.mark.skipif(
+    engine.dialect.name != "postgresql",
+    reason="SQLite is used by a single bot process",
+)
+
+
+def run(coroutine):
+    """Runs the coroutine in a new event loop and closes the connections it opened."""
+
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+@pytest.fixture(name="database")
+def fixture_database():
+    """A Database whose tables are all dropped."""
+
+    async def drop_tables():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.drop_all)
+
+    run(drop_tables())
+    return Database()
+
+
+async def create_group(database, members: int = 4) -> tuple[int, list[int]]:
+    """Migrates and creates a group of users with 64-bit ids."""
+
+    await database.migrate()
+    user_ids = [BIG_ID + n for n in range(members)]
+    for n, user_id in enumerate(user_ids):
+        await database.insert_user(user_id, f"user{n}")
+    await database.create_group("Group", user_ids[0])
+    group_id = (await database.get_user_groups(user_ids[0]))[0].id
+    for n in range(1, members):
+        await database.add_user_to_group(group_id, f"user{n}")
+    return group_id, user_ids
+
+
+async def share_tracks(database, group_id: int, user_ids: list[int], count: int):
+    """Shares `count` tracks in the group in turn by its members."""
+
+    return [
+        await database.insert_music(
+            yandex_id=100 + n,
+            title=f"Artist — Track {n}",
+            type_of_music="track",
+            message="",
+            photo_uri="",
+            user_id=user_ids[n % len(user_ids)],
+            group_id=group_id,
+            album_id=5,
+            artists=["Artist"],
+        )
+        for n in range(count)
+    ]
+
+
+def test_new_database_is_created_at_latest_version(database):
+    """A new database skips the migrations, which are not applied again."""
+
+    async def main():
+        return await database.migrate(), await database.migrate()
+
+    latest, _, _ = migrations()[-1]
+    assert run(main()) == ([latest], [])
+
+
+@postgresql_only
+def test_concurrent_migrations_apply_once(database):
+    """Two processes starting together don't both record the schema version."""
+
+    async def main():
+        return await asyncio.gather(database.migrate(), Database().migrate())
+
+    latest, _, _ = migrations()[-1]
+    assert sorted(run(main())) == [[], [latest]]
+
+
+@postgresql_only
+def test_lock_is_held_across_connections(database):
+    """A held lock can't be taken by another connection, as by another process."""
+
+    async def try_lock(name: str) -> bool:
+        async with engine.connect() as connection:
+            return await connection.scalar(
+                text("SELECT pg_try_advisory_lock(hashtext(:name))"), {"name": name}
+            )
+
+    async def main():
+        async with database.lock("test"):
+            held = await try_lock("test")
+        return held, await try_lock("test")
+
+    assert run(main()) == (False, True)
+
+
+def test_group_members(database):
+    """Members with 64-bit ids are stored and listed in id order."""
+
+    async def main():
+        group_id, user_ids = await create_group(database)
+        group = await database.get_group_with_users(group_id)
+        return user_ids, [user.id for user in group.users]
+
+    user_ids, member_ids = run(main())
+    assert member_ids == user_ids
+
+
+def test_rating_aggregates_match_recompute(database):
+    """Queued and direct votes keep the aggregates equal to a full recompute."""
+
+    async def main():
+        group_id, user_ids = await create_group(database)
+        music_ids = await share_tracks(database, group_id, user_ids, 12)
+
+        queue = RatingQueue(database)
+        rnd = random.Random(2)
+        for _ in range(80):
+            await queue.put(
+                rnd.choice(user_ids), rnd.choice(music_ids), rnd.randint(0, 5)
+            )
+        await queue.close()
+        await database.rate_music(user_ids[1], music_ids[0], 4)
+        await database.delete_track(music_ids[3])
+
+        statistics = [await database.get_user_statistic(i) for i in user_ids]
+        await database.recompute_rating_aggregates()
+        return statistics, [await database.get_user_statistic(i) for i in user_ids]
+
+    def rounded(statistic: dict) -> dict:
+        # Running sums and a recompute add the same marks in a different order
+        return {
+            key: round(value, 9) if isinstance(value, float) else value
+            for key, value in statistic.items()
+        }
+
+    statistics, recomputed = run(main())
+    assert list(map(rounded, statistics)) == list(map(rounded, recomputed))
+
+
+def test_sharing_pages(database):
+    """Keyset pages go forward and back in id order."""
+
+    async def main():
+        group_id, user_ids = await create_group(database)
+        music_ids = await share_tracks(database, group_id, user_ids, 12)
+        first = await database.get_sharing_page(group_id=group_id, limit=5)
+        second = await database.get_sharing_page(
+            group_id=group_id, after_id=first[0][-1].id, limit=5
+        )
+        previous = await database.get_sharing_page(
+            group_id=group_id, before_id=second[0][0].id, limit=5
+        )
+        last = await database.get_sharing_page(
+            user_id=user_ids[1], after_id=music_ids[5], limit=5
+        )
+        return music_ids, [
+            ([music.id for music in page], has_previous, has_next)
+            for page, has_previous, has_next in (first, second, previous, last)
+        ]
+
+    music_ids, pages = run(main())
+    assert pages == [
+        (music_ids[:5], False, True),
+        (music_ids[5:10], True, True),
+        (music_ids[:5], False, True),
+        ([music_ids[9]], True, False),
+    ]
+
+
+def test_pulled_tracks_are_inserted_once(database):
+    """Tracks pulled concurrently into the group get a single history row each."""
+
+    def tracks(*yandex_ids):
+        return [
+            {
+                "yandex_id": yandex_id,
+                "title": f"Track {yandex_id}",
+                "message": "",
+                "photo_uri": "",
+                "user_id": BIG_ID,
+            }
+            for yandex_id in yandex_ids
+        ]
+
+    async def pull(group_id: int, music_list: list[dict]) -> list[int]:
+        async with database.lock(f"reconcile_group:{group_id}"):
+            return await database.insert_new_group_tracks(group_id, music_list)
+
+    async def main():
+        group_id, _ = await create_group(database)
+        inserted = await asyncio.gather(
+            pull(group_id, tracks(1, 2, 2)), pull(group_id, tracks(2, 3))
+        )
+        async with engine.connect() as connection:
+            result = await connection.execute(
+                select(Music.yandex_id, func.count())
+                .where(Music.group_id == group_id)
+                .group_by(Music.yandex_id)
+            )
+            return inserted, dict(result.all())
+
+    inserted, rows = run(main())
+    assert sorted(sum(inserted, [])) == [1, 2, 3]
+    assert rows == {1: 1, 2: 1, 3: 1}
+
+
+def test_concurrent_metadata_upserts(database):
+    """Caching the same metadata at the same time leaves one row per track."""
+
+    records = [
+        {
+            "type_of_music": "track",
+            "yandex_id": yandex_id,
+            "title": "Track",
+            "artists": '["Artist"]',
+            "album_id": None,
+            "cover_uri": None,
+            "fetched_at": int(time.time()) + yandex_id,
+        }
+        for yandex_id in range(10)
+    ]
+
+    async def main():
+        await database.migrate()
+        await asyncio.gather(
+            database.save_music_metadata(records),
+            database.save_music_metadata(records),
+        )
+        return await database.get_music_metadata("track", list(range(10)))
+
+    assert len(run(main())) == 10
+
+
+def test_playlist_owner_uid_is_64_bit(database):
+    """Yandex Music uids of playlist owners exceed 32 bits."""
+
+    async def main():
+        group_id, user_ids = await create_group(database)
+        await database.create_playlist_for_user_in_group(
+            user_ids[0], group_id, 1003, 1_500_000_000_000
+        )
+        return await database.get_playlist(user_ids[0], group_id)
+
+    playlist = run(main())
+    assert (playlist.uid, playlist.kind) == (1_500_000_000_000, "1003")
+
+
+def test_delete_group(database):
+    """A member leaves the group, the creator deletes it and keeps the history."""
+
+    async def main():
+        group_id, user_ids = await create_group(database)
+        music_ids = await share_tracks(database, group_id, user_ids, 4)
+
+        await database.delete_group(user_ids[1], group_id)
+        group = await database.get_group_with_users(group_id)
+        members = [user.id for user in group.users]
+
+        await database.delete_group(user_ids[0], group_id)
+        music = await database.get_music_by_id(music_ids[0])
+        return members, await database.get_group_name(group_id), music.group_id
+
+    user_ids = [BIG_ID + n for n in range(4)]
+    assert run(main()) == ([user_ids[0]] + user_ids[2:], None, None)
+
+
+def test_music_metadata_is_looked_up_once(database):
+    """Music without metadata is left out once its lookup has been recorded."""
+
+    async def main():
+        group_id, user_ids = await create_group(database)
+        music_ids = [
+            await database.insert_music(
+                yandex_id=200 + n,
+                title=f"Artist — Track {n}",
+                type_of_music="track",
+                message="",
+                photo_uri="",
+                user_id=user_ids[0],
+                group_id=group_id,
+            )
+            for n in range(3)
+        ]
+        await database.update_music_metadata(
+            music_ids[:2], {music_ids[0]: (5, ["Artist"])}
+        )
+        return music_ids, await database.get_music_without_metadata()
+
+    music_ids, without_metadata = run(main())
+    assert [music.id for music in without_metadata] == [music_ids[2]]
@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+
+from bot.client_pool import client_pool
+from bot.metadata_cache import MusicInfo
+from bot.models import Base, engine
+from bot.music import apply_playlist_diff, reconcile_group, unsyncable_tracks
+from bot.utils import database as bot_database
+
+PLAYLISTS_LIST = "/users/{uid}/playlists/list"
+
+
+@pytest.fixture(name="database")
+def fixture_database():
+    """The bot's Database, with all tables dropped and no tracks known unsyncable."""
+
+    async def drop_tables():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.drop_all)
+        await engine.dispose()
+
+    asyncio.run(drop_tables())
+    unsyncable_tracks.clear()
+    return bot_database
+
+
+def track_info(yandex_id: int) -> MusicInfo:
+    """Info of a track of the fake catalog, as `fetch_music` returns it."""
+
+    return MusicInfo(
+        type_of_music="track",
+        yandex_id=yandex_id,
+        title=f"Track {yandex_id}",
+        artists=[f"Artist {yandex_id % 97}"],
+        album_id=100_000 + (yandex_id - 1) // 10,
+        cover_uri=None,
+    )
+
+
+def track_ids(playlist: dict) -> list[int]:
+    """Ids of the tracks of a fake playlist, top first."""
+
+    return [int(track["id"]) for track in playlist["tracks"]]
+
+
+def test_playlist_diff_puts_tracks_on_top_newest_first(serve, yandex_music):
+    """Tracks inserted by several chunks end up newest first, above the old ones."""
+
+    async def main():
+        client = await client_pool.get(1, "token-1")
+        playlist = await client.users_playlists_create("Group")
+        playlist = await apply_playlist_diff(
+            client,
+            playlist.kind,
+            playlist.revision,
+            insert_tracks=[track_info(n) for n in (1, 2, 3)],
+        )
+        return await apply_playlist_diff(
+            client,
+            playlist.kind,
+            playlist.revision,
+            insert_tracks=[track_info(n) for n in range(10, 220)],
+            delete_indexes=[0, 2],
+        )
+
+    playlist = serve(main())
+    fake_playlist = yandex_music.account(playlist.owner.uid).playlists[playlist.kind]
+    assert track_ids(fake_playlist) == list(range(219, 9, -1)) + [2]
+    assert (playlist.revision, playlist.track_count) == (5, 211)
+
+
+def test_reconcile_group(serve, yandex_music, database):
+    """
+    Members get the group's tracks they miss, tracks added in Yandex Music are
+    shared with the group, and an unchanged group is checked by listing playlists.
+    """
+
+    unsyncable_track_id = 254
+    yandex_music.tracks[unsyncable_track_id]["albums"] = []
+
+    async def main():
+        await database.migrate()
+        for user_id in (1, 2):
+            await database.insert_user(user_id, f"user{user_id}")
+            await database.update_user_token(user_id, f"token-{user_id}")
+        await database.create_group("Group", 1)
+        group_id = (await database.get_user_groups(1))[0].id
+        await database.add_user_to_group(group_id, "user2")
+
+        for yandex_id in (251, 252, 253, unsyncable_track_id):
+            await database.insert_music(
+                yandex_id=yandex_id,
+                title=f"Track {yandex_id}",
+                type_of_music="track",
+                message="",
+                photo_uri="",
+                user_id=1,
+                group_id=group_id,
+            )
+        playlists = {}
+        for user_id in (1, 2):
+            client = await client_pool.get(user_id, f"token-{user_id}")
+            playlist = await client.users_playlists_create("Group")
+            await database.create_playlist_for_user_in_group(
+                user_id, group_id, playlist.kind, playlist.owner.uid
+            )
+            playlists[user_id] = yandex_music.account(playlist.owner.uid).playlists[
+                playlist.kind
+            ]
+
+        await reconcile_group(group_id)
+        synced = [track_ids(playlists[user_id]) for user_id in (1, 2)]
+
+        # The second member adds a track in the Yandex Music app
+        playlists[2]["tracks"].insert(0, {"id": "260", "albumId": None})
+        playlists[2]["trackCount"] += 1
+        playlists[2]["revision"] += 1
+        await reconcile_group(group_id)
+        pulled = [track_ids(playlists[user_id]) for user_id in (1, 2)]
+
+        requests_before = dict(yandex_music.requests)
+        await reconcile_group(group_id)
+        requests = {
+            endpoint: count - requests_before.get(endpoint, 0)
+            for endpoint, count in yandex_music.requests.items()
+            if count != requests_before.get(endpoint, 0)
+        }
+
+        shared = [
+            music.yandex_id for music in await database.get_group_sharing(group_id)
+        ]
+        return synced, pulled, requests, shared
+
+    synced, pulled, requests, shared = serve(main())
+    assert synced == [[253, 252, 251], [253, 252, 251]]
+    assert pulled == [[260, 253, 252, 251], [260, 253, 252, 251]]
+    assert requests == {PLAYLISTS_LIST: 2}
+    assert shared == [251, 252, 253, unsyncable_track_id, 260]
@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from bot.rating_queue import RatingQueue
+
+
+class RecordingDatabase:
+    """Records the rating batches written, failing the first `failures` writes."""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.batches = []
+
+    async def rate_music_batch(self, ratings: dict[tuple[int, int], int]) -> None:
+        """Records the batch, or fails while failures are left."""
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("The database is down")
+        self.batches.append(dict(ratings))
+
+
+def test_votes_are_coalesced():
+    """A user changing their mark only leaves the last one, written in one batch."""
+
+    database = RecordingDatabase()
+
+    async def main():
+        queue = RatingQueue(database, interval=60, max_size=10)
+        await queue.put(1, 10, 3)
+        await queue.put(2, 10, 4)
+        await queue.put(1, 10, 5)
+        await queue.put(1, 11, 1)
+        pending = len(queue)
+        await queue.close()
+        return pending
+
+    assert asyncio.run(main()) == 3
+    assert database.batches == [{(1, 10): 5, (2, 10): 4, (1, 11): 1}]
+
+
+def test_votes_are_flushed_by_size_and_time():
+    """Votes are written once `max_size` are pending, or `interval` after the first."""
+
+    database = RecordingDatabase()
+
+    async def main():
+        queue = RatingQueue(database, interval=0.05, max_size=2)
+        await queue.put(1, 10, 3)
+        await queue.put(1, 11, 4)
+        by_size = list(database.batches)
+
+        await queue.put(1, 12, 5)
+        await asyncio.sleep(0.1)
+        return by_size, len(queue)
+
+    by_size, pending = asyncio.run(main())
+    assert by_size == [{(1, 10): 3, (1, 11): 4}]
+    assert database.batches[1:] == [{(1, 12): 5}]
+    assert pending == 0
+
+
+def test_flush_user_writes_pending_votes():
+    """A user's pending votes are written before their ratings are read."""
+
+    database = RecordingDatabase()
+
+    async def main():
+        queue = RatingQueue(database, interval=60, max_size=10)
+        await queue.put(1, 10, 3)
+        await queue.flush_user(2)
+        before = list(database.batches)
+        await queue.flush_user(1)
+        await queue.close()
+        return before
+
+    assert not asyncio.run(main())
+    assert database.batches == [{(1, 10): 3}]
+
+
+def test_failed_flush_is_retried():
+    """
+    A DB error doesn't reach the handler that queued the vote: the votes stay
+    queued for a scheduled flush, keeping newer votes. Only close() raises.
+    """
+
+    database = RecordingDatabase(failures=2)
+
+    async def main():
+        queue = RatingQueue(database, interval=0.05, max_size=2)
+        await queue.put(1, 10, 3)
+        await queue.put(1, 11, 4)
+        await queue.put(1, 10, 5)
+        await queue.flush_user(1)
+        await asyncio.sleep(0.1)
+        return len(queue)
+
+    assert asyncio.run(main()) == 0
+    assert database.batches == [{(1, 10): 5, (1, 11): 4}]
+
+    async def close():
+        queue = RatingQueue(RecordingDatabase(failures=1), interval=60)
+        await queue.put(1, 10, 3)
+        await queue.close()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(close())
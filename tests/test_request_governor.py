@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+from yandex_music.exceptions import (
+    BadRequestError,
+    NetworkError,
+    TimedOutError,
+    UnauthorizedError,
+)
+
+from bot.request_governor import IDEMPOTENT_POST_PATTERN, RequestGovernor
+
+
+def failing(*errors):
+    """Returns a request that raises the errors in turn, then answers "ok"."""
+
+    calls = []
+
+    async def send():
+        calls.append(None)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return "ok"
+
+    send.calls = calls
+    return send
+
+
+def connection_error() -> NetworkError:
+    """A NetworkError caused by a connection problem, as raised by yandex_music."""
+
+    try:
+        raise NetworkError("Cannot connect") from OSError("Connection refused")
+    except NetworkError as e:
+        return e
+
+
+@pytest.mark.parametrize(
+    "error, kind",
+    [
+        (TimedOutError(), "transient"),
+        (NetworkError("Too Many Requests (429): {}"), "throttled"),
+        (NetworkError("Internal Server Error (500): {}"), "transient"),
+        (NetworkError("Service Unavailable (503): {}"), "transient"),
+        (NetworkError("Bad Gateway"), "transient"),
+        (connection_error(), "transient"),
+        (NetworkError("I'm a teapot (418): {}"), None),
+        (NetworkError("Something else"), None),
+        (UnauthorizedError("session-expired"), None),
+        (BadRequestError("validate"), None),
+    ],
+)
+def test_classify(error, kind):
+    """Only throttling and transient errors are worth retrying."""
+
+    assert RequestGovernor.classify(error) == kind
+
+
+@pytest.mark.parametrize(
+    "url, idempotent",
+    [
+        ("https://api.music.yandex.net/tracks", True),
+        ("https://api.music.yandex.net/albums", True),
+        ("https://api.music.yandex.net/users/1/playlists/list", True),
+        ("https://api.music.yandex.net/users/1/playlists", True),
+        ("https://api.music.yandex.net/users/1/playlists/1003/change", True),
+        ("https://api.music.yandex.net/users/1/playlists/create", False),
+        ("https://api.music.yandex.net/users/1/likes/tracks/add-multiple", False),
+    ],
+)
+def test_idempotent_posts(url, idempotent):
+    """Reads sent as POST and revision-guarded playlist changes are idempotent."""
+
+    assert bool(IDEMPOTENT_POST_PATTERN.search(url)) is idempotent
+
+
+def test_transient_error_is_retried_if_idempotent():
+    """A request that may have gone through is only resent if it is idempotent."""
+
+    governor = RequestGovernor(backoff_base=0, backoff_max=0)
+    error = NetworkError("Internal Server Error (500): {}")
+
+    idempotent = failing(error)
+    assert asyncio.run(governor.run("token", idempotent)) == "ok"
+    assert len(idempotent.calls) == 2
+
+    not_idempotent = failing(error)
+    with pytest.raises(NetworkError):
+        asyncio.run(governor.run("token", not_idempotent, idempotent=False))
+    assert len(not_idempotent.calls) == 1
+
+
+def test_throttled_request_is_always_retried():
+    """A throttled request was not processed, so it is resent either way."""
+
+    governor = RequestGovernor(backoff_base=0, backoff_max=0)
+    send = failing(NetworkError("Too Many Requests (429): {}"))
+
+    assert asyncio.run(governor.run("token", send, idempotent=False)) == "ok"
+    assert len(send.calls) == 2
+    assert governor.stats()["throttled"] == 1
+
+
+def test_retries_are_limited():
+    """A request is given up after max_retries, or when the retry budget runs out."""
+
+    error = TimedOutError()
+
+    governor = RequestGovernor(max_retries=2, backoff_base=0, backoff_max=0)
+    send = failing(*[error] * 5)
+    with pytest.raises(TimedOutError):
+        asyncio.run(governor.run("token", send))
+    assert len(send.calls) == 3
+    assert governor.stats()["retries_exhausted"] == 1
+
+    governor = RequestGovernor(
+        retry_rate=0.001, retry_burst=1, backoff_base=0, backoff_max=0
+    )
+    send = failing(*[error] * 5)
+    with pytest.raises(TimedOutError):
+        asyncio.run(governor.run("token", send))
+    assert len(send.calls) == 2
+    assert governor.stats()["retry_budget_exhausted"] == 1
+
+
+def test_unretryable_error_is_raised_at_once():
+    """Errors that won't succeed on retry aren't resent."""
+
+    governor = RequestGovernor(backoff_base=0, backoff_max=0)
+    send = failing(UnauthorizedError("session-expired"))
+
+    with pytest.raises(UnauthorizedError):
+        asyncio.run(governor.run("token", send))
+    assert len(send.calls) == 1